@@ -0,0 +1,208 @@
+"""
+headless render benchmark for the donut pipeline
+
+Builds a data_donut.app.DonutApp for an app config (no bokeh server - its models are just built in memory),
+then for each snapshot pickle swaps in that month's dataset and replays a set of widget states:
+every country_dd preset, every cat_select_menu entry and sweeps of the four size sliders.
+Reports per-stage timings (p50 / p95 ms) for select_data, donut_geometry, format_cat_df,
+create_rec_df_dict, merge_small_wedges, plot_chart (uncached & cached) and JSON serialization of the figure,
+plus the serialized size and peak traced memory of a full replay (a separate, slower pass under
+tracemalloc - skip it with --no-memory).
+
+It runs in a temporary folder with links to the repo's pickles, so the snapshots, filter indexes and history
+store the app writes go there (and no static pages are rendered) - a run leaves the working tree as it was.
+
+usage (from the repo root):
+    python benchmarks/bench_donut.py                     # every pickle in data_archive/
+    python benchmarks/bench_donut.py df_output_for_donut_0924.pkl --repeat 3 > bench_output.txt
+    python benchmarks/bench_donut.py --app eden          # eden config (usage & exclusivity)
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stages = ['select_data', 'donut_geometry', 'format_cat_df', 'create_rec_df_dict', 'merge_small_wedges',
+          'plot_chart', 'plot_chart_cached', 'serialize']
+
+
+def work_folder():
+    """
+    a temporary folder laid out as the repo root, with links to its pickles (root & data_archive) - the
+    app's snapshots, filter indexes & history store are written there
+    """
+    folder = tempfile.mkdtemp(prefix='bench_donut-')
+    for sub in ['', 'data_archive']:
+        os.makedirs(os.path.join(folder, sub), exist_ok=True)
+        for path in glob.glob(os.path.join(root, sub, 'df_output_for_donut_*.pkl')):
+            os.symlink(path, os.path.join(folder, sub, os.path.basename(path)))
+    return folder
+
+
+def work_path(folder, path):
+    """
+    a pickle path (relative to where the benchmark was started) in the work folder, if it is one of the repo's
+    """
+    relative = os.path.relpath(os.path.abspath(path), root)
+    return os.path.join(folder, relative) if os.path.exists(os.path.join(folder, relative)) else path
+
+
+def load_app(name='prod'):
+    """
+    builds the app for a data_donut.config app config (its widgets & chart, outside any server) - run in the
+    current folder (see work_folder)
+    """
+    sys.path.insert(0, root)
+    warnings.filterwarnings('ignore')
+    logging.getLogger('bokeh.embed.util').setLevel(logging.ERROR)   # python callbacks in standalone output
+    from data_donut import config
+    from data_donut.app import DonutApp
+    # no background reloads or static pages
+    return DonutApp(dict(getattr(config, name), reload_seconds=0, static_folder=None))
+
+
+def use_dataset(app, path):
+    """
+    swaps a snapshot's prepared dataset into the app & its widgets (converting the snapshot first if needed)
+    """
+    from data_donut import shared, snapshot
+    if not snapshot.is_current(snapshot.snapshot_dir(path), path):
+        snapshot.convert(path)
+    dataset = shared.get_dataset(path, usage=app.config['usage'])
+    app.set_dataset(dataset)
+    return dataset
+
+
+def widget_states(app):
+    """
+    widget states to replay - dicts of widget name: value (sliders in m, as on the page)
+    """
+    n_countries = len(app.dataset['country_list'])
+    defaults = {'cat_select': 'ALL', 'country': list(range(n_countries)), 'hintable': 2,
+                'recordtype': [0, 1, 2, 3], 'cat_min': 0, 'cat_max': app.cat_max.end,
+                'recordset_min': 0, 'recordset_max': app.recordset_max.end}
+    states = []
+    for name in app.country_dropdown.options:
+        states.append(dict(defaults, country=app.preset_countries(name)))
+    for category in app.dataset['cat_select_menu'][1:]:
+        states.append(dict(defaults, cat_select=category, cat_max=1000))
+    for value in [5, 20, 50, 100, 200]:
+        states.append(dict(defaults, cat_min=value))
+    for value in [1000, 400, 100, 20]:
+        states.append(dict(defaults, cat_max=value))
+    for value in [0.001, 0.01, 0.1, 0.5, 1.0]:
+        states.append(dict(defaults, recordset_min=value))
+    for value in [100, 10, 1, 0.5]:
+        states.append(dict(defaults, recordset_max=value))
+    for hint in [0, 1]:
+        states.append(dict(defaults, hintable=hint))
+    states.append(dict(defaults, recordtype=[0]))
+    return states
+
+
+def set_widgets(app, state):
+    app.cat_select.value = state['cat_select']  # (its callback resets the cat sliders - so set first)
+    app.country.active = state['country']
+    app.hintable.active = state['hintable']
+    app.recordtype.active = state['recordtype']
+    for name in ['cat_min', 'cat_max', 'recordset_min', 'recordset_max']:
+        getattr(app, name).value = state[name]
+
+
+def timed(timings, stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings[stage].append(time.perf_counter() - start)
+    return result
+
+
+def replay(app, states, timings, sizes):
+    """
+    runs every state through each pipeline stage, appending stage durations to timings
+    """
+    from bokeh.embed import json_item
+    from data_donut import cache, data, geometry
+    radii = geometry.set_default_rads(show_usage=False, show_exclusive=app.config['exclusive'])
+    min_angle = math.radians(app.config.get('min_wedge_degrees', 0))
+    for state in states:
+        set_widgets(app, state)
+        selection = dict(cat_min=state['cat_min']*1000000, cat_max=state['cat_max']*1000000,
+                         rec_min=state['recordset_min']*1000000, rec_max=state['recordset_max']*1000000,
+                         country=state['country'], hintable=state['hintable'], recordtype=state['recordtype'],
+                         cat_select=state['cat_select'])
+        used_data = timed(timings, 'select_data', data.select_data, app.dataset, **selection)
+        if used_data.shape[0] > 0:
+            wedges = timed(timings, 'donut_geometry', geometry.donut_geometry, used_data, radii)
+            timed(timings, 'format_cat_df', geometry.format_cat_df, wedges)
+            rec_data = timed(timings, 'create_rec_df_dict', geometry.create_rec_df_dict, wedges, used_data)
+            timed(timings, 'merge_small_wedges', geometry.merge_small_wedges, rec_data,
+                  used_data['category'].values[wedges['order']], radii, min_angle)
+        cache.clear()
+        timed(timings, 'plot_chart', app.plot_chart)
+        timed(timings, 'plot_chart_cached', app.plot_chart)
+        payload = timed(timings, 'serialize', lambda: json.dumps(json_item(app.chart['figure'])))
+        sizes.append(len(payload))
+
+
+def summarize(label, timings, sizes, peak):
+    memory = 'peak traced memory {:,.1f} MB'.format(peak/1024/1024) if peak is not None else 'memory not traced'
+    lines = ['{}  ({} states, json p50 {:,.0f} KB, {})'.format(label, len(sizes), np.percentile(sizes, 50)/1024,
+                                                               memory)]
+    lines.append('    {:<20}{:>10}{:>10}{:>10}'.format('stage', 'p50 ms', 'p95 ms', 'runs'))
+    for stage in stages:
+        values = np.array(timings[stage])*1000
+        if len(values):
+            lines.append('    {:<20}{:>10.2f}{:>10.2f}{:>10}'.format(stage, np.percentile(values, 50),
+                                                                    np.percentile(values, 95), len(values)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('pickles', nargs='*', help='snapshot pickles (default: data_archive/*.pkl)')
+    parser.add_argument('--app', default='prod', help='data_donut.config app config (default prod)')
+    parser.add_argument('--repeat', type=int, default=1, help='replays per snapshot (default 1)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory (tracemalloc) pass')
+    args = parser.parse_args(argv)
+
+    folder = work_folder()
+    paths = [work_path(folder, x) for x in args.pickles]
+    os.chdir(folder)
+    try:
+        run(load_app(args.app), paths or sorted(glob.glob(os.path.join('data_archive', 'df_output_for_donut_*.pkl'))),
+            args)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run(app, paths, args):
+    for path in paths:
+        use_dataset(app, path)
+        states = widget_states(app)
+        replay(app, states, {stage: [] for stage in stages}, [])  # warm up
+        timings, sizes = {stage: [] for stage in stages}, []
+        for _ in range(args.repeat):
+            replay(app, states, timings, sizes)
+
+        peak = None
+        if not args.no_memory:
+            tracemalloc.start()
+            replay(app, states, {stage: [] for stage in stages}, [])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(summarize(os.path.basename(path), timings, sizes, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+data_donut - the findmypast dataset donut apps
+
+    formatting, snapshot, data, geometry  - master data formatting, storage, selection & wedge geometry
+                                            (numpy / pandas only)
+    usage                                 - usage ring radii, colour buckets & percentiles
+    shared, cache                         - per-process dataset store & chart data cache
+    watch                                 - background reload of new monthly files
+    compare, history                      - month-over-month comparison & the all-months history store
+    config                                - settings for each app (data file, usage date, country presets)
+    tooltips                              - tooltip templates & the recordset columns they use
+    app, static                           - the bokeh app (DonutApp) & its pre-rendered preset pages - the only
+                                            modules importing bokeh
+
+Submodules are not imported here, so importing the data modules never pays for bokeh.
+"""
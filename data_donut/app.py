@@ -0,0 +1,831 @@
+"""
+the bokeh donut app - widgets, the persistent chart & callbacks for one browser session
+
+With data_donut.static, the only data_donut modules that import bokeh. An entry point script (data_summary_prod.py,
+data_summary_prod_eden.py) builds a DonutApp from its settings in data_donut.config and adds its
+layout to curdoc(); the dataset comes from the process-wide store (data_donut.shared, following new
+months through data_donut.watch) and chart data from shared.chart_data - select_data & geometry, cached
+across sessions (data_donut.cache). Tooltip templates are in data_donut.tooltips. Widget callbacks run
+the data stage on a thread pool and update the document on a later tick (DonutApp.in_background), so one
+session's redraw never holds up the others on the server's event loop. The usage ring (usage apps) is
+shown & hidden in the browser (USAGE_JS) - chart data carries the wedge radii for both layouts. A session opened with
+?preset=<country_dd name> (from a static pre-rendered view) starts on that country quick selection. Apps with
+client_filters filter the hintability, recordtype & country controls in the browser (CLIENT_FILTER_JS): the chart
+sources hold every recordset the other settings select & CDSViews show the ones the click controls pick.
+"""
+import logging
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from math import pi
+
+import numpy as np
+
+# Bokeh Library
+from bokeh.plotting import figure
+from bokeh.models import HoverTool, TapTool, PanTool, ResetTool, WheelZoomTool, Paragraph, SaveTool, CustomJSHover, CustomJS
+from bokeh.models import CDSView, CustomJSFilter
+from bokeh.layouts import column, row
+from bokeh.models.widgets import Slider, Select, RadioButtonGroup, Button, CheckboxGroup, Toggle
+from bokeh.models.sources import ColumnDataSource
+from bokeh.models.annotations import Label
+
+from data_donut import compare, data, geometry, metrics, shared, tooltips, watch
+from data_donut.usage import ug_cent, ug_half, ug_over
+
+### ### ### filter out hover warnings
+warnings.filterwarnings("ignore", message="HoverTool are being repeated")
+
+width = 850
+height = 900
+background = 'white'
+settle_ms = 300   # live sliders - redraw this long after the last slider release
+
+log = logging.getLogger(__name__)
+
+# data stage of redraws & month switches (selection, geometry, loading) - shared by all sessions, off the IOLoop
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='data_donut')
+
+# hover formatter for @detail_id{<column>} (data_donut.tooltips): the column's text for the hovered recordset
+# from the session's detail source - asking the server for the recordset (through the source's tags) first time
+DETAIL_JS = """
+    if (value == null || isNaN(value)) {
+        return '';
+    }
+    const i = detail.data['detail_id'].indexOf(value);
+    if (i >= 0) {
+        return detail.data[format][i];
+    }
+    if (!detail.tags.includes(value)) {
+        detail.tags = detail.tags.concat([value]);
+    }
+    return 'loading...';
+"""
+
+# usage toggle - shows / hides the usage ring & switches the wedges to the radii that make room for it
+# (geometry.usage_ring_cols), without asking the server
+USAGE_JS = """
+    const show = toggle.active;
+    const suffix = show ? '_usage' : '';
+    const r = show ? usage_radii : radii;
+    for (const renderer of wedges) {
+        for (const glyph of [renderer.glyph, renderer.nonselection_glyph, renderer.hover_glyph, renderer.muted_glyph]) {
+            if (glyph != null && typeof glyph != 'string') {
+                glyph.inner_radius = {field: 'inner' + suffix};
+                glyph.outer_radius = {field: 'outer' + suffix};
+            }
+        }
+    }
+    hint.radius = r.radius_3 + r.hint_inc;
+    lines.inner_radius = r.radius_0;
+    lines.outer_radius = r.radius_3 + r.line_inc_outer;
+    for (const renderer of ring) {
+        renderer.visible = show;
+    }
+    toggle.label = show ? 'HIDE usage' : 'SHOW usage';
+"""
+
+# taptool - opens the tapped recordsets' search pages (as OpenURL), skipping merged 'Other N datasets' wedges,
+# which have no dataset_url
+TAP_JS = """
+    const source = cb_data.source;
+    for (const i of source.selected.indices) {
+        const path = source.data['dataset_url'][i];
+        if (path) {
+            window.open(url.replace('@dataset_url', encodeURI(path)));
+        }
+    }
+"""
+
+# client_filters - the wedges the click controls show (the sources' shown column)
+SHOWN_JS = """
+    const shown = source.data['shown'];
+    return shown != null && shown.length == source.get_length() ? Array.from(shown, Boolean) : null;
+"""
+
+# client_filters - lays the chart out for the click controls, as geometry.client_layout does on the server:
+# categories re-ranked & recordsets re-tiled over the shown events, colours, alphas, category lines & counts.
+# runs on each click & whenever the server sends new chart data (all in place - the server's copy is its own)
+CLIENT_FILTER_JS = """
+    const rec = rec_source.data;
+    const cat = cat_source.data;
+    if (rec['click_bits'] == null || cat['start'] == null || rec['click_bits'].length == 0) {
+        return;
+    }
+    const n = rec['events'].length;
+    const n_cats = cat['start'].length;
+    const hint = [1, 2, 3][hintable.active];
+    let types = 0;
+    for (const i of recordtype.active) {
+        types |= 4 << i;
+    }
+    let countries = 0;
+    for (const i of country.active) {
+        countries |= 1 << i;
+    }
+    const comparing = rec['change'] != null;
+    const items = rec['events_now'] != null ? rec['events_now'] : rec['events'];
+
+    // shown recordsets (data.client_mask) & their category totals
+    const shown = new Array(n);
+    const events = new Float64Array(n);
+    const cat_events = new Float64Array(n_cats);
+    const cat_items = new Float64Array(n_cats);   // (events_now in comparisons - events only size the wedges)
+    const changes = {};
+    let total = 0, total_items = 0, datasets = 0, delta = 0;
+    for (let i = 0; i < n; i++) {
+        const bits = rec['click_bits'][i];
+        shown[i] = (bits & hint) != 0 && (bits & types) != 0
+            && (country.active.length == 0 || (rec['country_word'][i] & countries) != 0);
+        if (!shown[i]) {
+            continue;
+        }
+        events[i] = rec['events'][i];
+        cat_events[rec['cat_rank'][i]] += events[i];
+        cat_items[rec['cat_rank'][i]] += isNaN(items[i]) ? 0 : items[i];
+        total += events[i];
+        total_items += isNaN(items[i]) ? 0 : items[i];
+        datasets += 1;
+        if (comparing) {
+            changes[rec['change'][i]] = (changes[rec['change'][i]] || 0) + 1;
+            delta += isNaN(rec['events_delta'][i]) ? 0 : rec['events_delta'][i];
+        }
+    }
+
+    // shown categories by events (desc), each spanning its share of the circle
+    const cat_order = [];
+    for (let c = 0; c < n_cats; c++) {
+        if (cat_events[c] > 0) {
+            cat_order.push(c);
+        }
+    }
+    cat_order.sort((a, b) => cat_events[b] - cat_events[a] || a - b);
+    const rank = new Int32Array(n_cats);
+    const offset = new Float64Array(n_cats);
+    let cum = 0;
+    cat_order.forEach((c, r) => {
+        rank[c] = r;
+        offset[c] = cum;
+        cum += cat_events[c];
+    });
+    const scale = total > 0 ? 2*Math.PI / total : 0;
+    const millions = (x) => {
+        const m = x / 1000000;
+        const d = m > 10 ? 1 : (m > 1 ? 2 : 3);
+        return m.toLocaleString('en-US', {minimumFractionDigits: d, maximumFractionDigits: d}) + ' m';
+    };
+    for (const c of cat_order) {
+        cat['start'][c] = start - offset[c]*scale;
+        cat['end'][c] = start - (offset[c] + cat_events[c])*scale;
+        cat['color'][c] = base_colors[rank[c] % base_colors.length];
+        for (const [col, value] of [['events', cat_items[c]], ['size', cat_events[c]*scale],
+                                    ['mid', (cat['start'][c] + cat['end'][c])/2],
+                                    ['str_from_events', millions(cat_items[c])]]) {
+            if (cat[col] != null) {
+                cat[col][c] = value;
+            }
+        }
+    }
+    cat['shown'] = Array.from(cat_events, (x) => x > 0);
+
+    // shown recordsets tile their category in source order (largest first)
+    const pos = Float64Array.from(offset);
+    const within = new Int32Array(n_cats);
+    for (let i = 0; i < n; i++) {
+        if (!shown[i]) {
+            continue;
+        }
+        const c = rec['cat_rank'][i];
+        rec['start'][i] = start - pos[c]*scale;
+        pos[c] += events[i];
+        rec['end'][i] = start - pos[c]*scale;
+        for (const [col, value] of [['size', events[i]*scale], ['mid', (rec['start'][i] + rec['end'][i])/2]]) {
+            if (rec[col] != null) {
+                rec[col][i] = value;
+            }
+        }
+        rec['alpha'][i] = rec_alphas[within[c] % rec_alphas.length];
+        within[c] += 1;
+        if (!comparing || !changed.includes(rec['change'][i])) {
+            rec['color'][i] = rec_colors[rank[c] % rec_colors.length];
+        }
+    }
+    rec['shown'] = shown;
+
+    const grouped = (x) => Math.round(x).toLocaleString('en-US');
+    item_count.text = grouped(total_items) + ' items';
+    recordset_count.text = datasets ? grouped(datasets) + ' datasets' : '';
+    cat_count.text = datasets ? grouped(cat_order.length) + ' categories' : '';
+    if (comparing) {
+        const count = (x) => grouped(changes[x] || 0);
+        change_count.text = change_count.text.split(':')[0] + ': ' + count('new') + ' new, '
+            + count('removed') + ' removed, ' + count('grown') + ' grown, ' + count('shrunk') + ' shrunk ('
+            + (delta < 0 ? '-' : '+') + grouped(Math.abs(delta)) + ' items)';
+    }
+    lines.data = {start: cat_order.map((c) => cat['start'][c])};
+    cat_source.change.emit();
+    rec_source.change.emit();
+"""
+
+
+def empty_columns(cols):
+    return {col: [] for col in cols}
+
+
+def same_column(old, new):
+    """
+    True if a ColumnDataSource column is unchanged (so needn't be sent to the browser again)
+    """
+    if len(old) != len(new):
+        return False
+    try:
+        return bool(np.array_equal(np.asarray(old), np.asarray(new)))
+    except (TypeError, ValueError):
+        return False
+
+
+def update_source(source, data):
+    """
+    puts new column data into a long-lived source - sending only changed columns when the shape allows it
+    (cached chart data is shared between sessions, so it is never patched / streamed into in place)
+    """
+    if set(source.data.keys()) == set(data.keys()) and all(len(source.data[k]) == len(data[k]) for k in data):
+        changed = {k: v for k, v in data.items() if not same_column(source.data[k], v)}
+        if changed:
+            source.data.update(changed)
+    else:
+        source.data = dict(data)
+
+
+class DonutApp:
+    """
+    one browser session's widgets, persistent chart & callbacks for an app config (data_donut.config).
+    its layout is ready to add to the session's document once built. given the document, the session is
+    told when a new month is loaded & offers it on the next UPDATE. without one (data_donut.static) redraws run
+    at once, on the given dataset if any
+    """
+
+    def __init__(self, config, doc=None, dataset=None):
+        self.config = config
+        self.doc = doc
+        if doc is not None:
+            unsubscribe = watch.subscribe(config, self.on_new_dataset)
+            metrics.session_opened()
+            doc.on_session_destroyed(lambda session_context: (unsubscribe(), metrics.session_closed()))
+            if config.get('metrics_port'):
+                metrics.serve(config['metrics_port'])
+        self.dataset = dataset if dataset is not None else watch.current_dataset(config)
+        self.pending_dataset = None   # new month, loaded by the watcher - switched to on UPDATE
+        self.generation = 0           # latest background request (in_background) - older results are dropped
+        self.future = None
+        self.dropped = None           # the running request's dropped() (in_background)
+        self.month_request = 0        # generation of the latest month switch (callback_6)
+        self.redraw_queued = False    # a redraw asked for while a month switch loads (redraw)
+        self.create_widgets()
+        self.chart = self.create_chart()
+        self.plot_chart()
+        self.layout = row([self.inputs_2, self.inputs, self.chart['figure']])
+
+    def create_widgets(self):
+        """
+        INPUT widgets, descriptor outputs & their change / click detectors
+        """
+        config, dataset = self.config, self.dataset
+        self.button = Button(label="UPDATE CHART", button_type="success")
+        self.output_status = Paragraph()
+        self.cat_min = Slider(start=0, end=400, value=0, step=0.5, title="Whole category min items (m)")
+        self.cat_max = Slider(start=0.5, end=config['cat_max_end'], value=config['cat_max_end'], step=0.5,
+                              title="Whole category max items (m)")
+        self.recordset_min = Slider(start=0, end=2, value=0, step=.001, title="Recordset min items (m)")
+        self.recordset_max = Slider(start=0.5, end=config['recordset_max_end'], value=config['recordset_max_end'],
+                                    step=0.5, title="Recordset max items (m)")
+        self.recordtype = CheckboxGroup(labels=list(data.type_list), active=[0, 1, 2, 3])
+        self.hintable = RadioButtonGroup(labels=["Hintable", "Not hintable", "All"], active=2)
+        hint_tip = Paragraph(text='Wedges extruded to outer circle (line) are hintable',
+                             style={'font-size': '80%', 'color': 'grey'})
+        controls_click = [self.recordtype, self.hintable, hint_tip]
+
+        self.exclusive = None   # all recordsets, unless the app has the exclusivity selector
+        if config['exclusive']:
+            self.exclusive = RadioButtonGroup(labels=["Exclusive", "Not exclusive", "All"], active=2)
+            excl_tip = Paragraph(text='Wedges separated from inner segments are exclusive',
+                                 style={'font-size': '80%', 'color': 'grey'})
+            controls_click += [self.exclusive, excl_tip]
+
+        self.country = CheckboxGroup(labels=dataset['country_list'],
+                                     active=[x for x in range(len(dataset['country_list']))])
+        country_title = Paragraph(text='Source Country contains:')
+
+        self.cat_select = Select(title="ALL or Single Category view:", value="ALL", options=dataset['cat_select_menu'])
+        self.country_dropdown = Select(title="Country quick selection:", value="ALL",
+                                       options=data.available_presets(dataset, config['country_dd']))
+        preset = self.start_preset()
+        if preset is not None:
+            self.country_dropdown.value = preset
+            self.country.active = self.preset_countries(preset)
+
+        # month to show & month to compare it with (apps with month_folders)
+        self.months = compare.month_files(config.get('month_folders', []))
+        self.month_select = self.compare_select = None
+        month_controls = []
+        if self.months:
+            self.month_select = Select(title="Month:", value=dataset['month'], options=list(self.months))
+            self.compare_select = Select(title="Compare with month:", value='None', options=['None'] + list(self.months))
+            month_controls = [Paragraph(), self.month_select, self.compare_select]
+        self.switching = False   # set_dataset is syncing the month & preset selectors
+
+        self.usage_toggle = self.usage_scope = None
+        if config['usage']:
+            self.usage_toggle = Toggle(label='SHOW usage', button_type='primary', active=False)
+            self.usage_scope = RadioButtonGroup(labels=["Usage in type: all", "In selection"], active=0)
+
+        # widget descriptor text outputs # disabled when countries added - no space left....
+        self.describe_text = [Paragraph() for _ in range(6)]
+
+        # creates widgets & output column
+        controls_chg = [self.cat_min, self.cat_max, self.recordset_min, self.recordset_max]
+        controls_click_2 = month_controls + [Paragraph(), self.country_dropdown, Paragraph(), country_title, self.country]  # blank Paragraph is blank line
+
+        # NOTE - adding describe_text puts in 'live' counts on inputs for inputs (LH) column
+        controls = ([Paragraph(), self.cat_select, Paragraph()]
+                    + ([self.usage_toggle, self.usage_scope] if self.usage_toggle else [])
+                    + [self.output_status, self.button] + controls_chg + controls_click)  # + describe_text
+
+        self.inputs = column(controls, width=300, height=height)
+        self.inputs_2 = column(controls_click_2, width=300, height=height)
+
+        # widget change & click detectors - with live sliders, counts follow the drag & the chart redraws
+        # once they settle
+        self.settle_timeout = None     # pending settled redraw
+        for widget in controls_chg:
+            if config.get('live_sliders'):
+                widget.on_change('value', self.callback_live)
+                widget.on_change('value_throttled', self.callback_settled)
+            else:
+                widget.on_change('value', self.callback)
+        if self.exclusive is not None:
+            self.exclusive.on_change('active', self.callback)
+        for widget in [self.hintable, self.recordtype, self.country]:
+            widget.on_change('active', self.callback_click)
+
+        # category select detector & country quick select dropdown (update immediately)
+        self.cat_select.on_change('value', self.callback_3)
+        self.country_dropdown.on_change('value', self.callback_4)
+        for widget in [self.month_select, self.compare_select]:
+            if widget is not None:
+                widget.on_change('value', self.callback_6)
+
+        # update button click detector
+        self.button.on_click(self.callback_2)
+        if self.usage_toggle:   # (the toggle itself is handled in the browser - see create_chart)
+            self.usage_scope.on_change('active', self.callback_7)
+
+    def create_chart(self):
+        """
+        creates the persistent figure (once per session). its glyphs are backed by long-lived
+        ColumnDataSources that plot_chart refills, rather than rebuilding the figure on each update
+        """
+        chart = {}
+        radii = geometry.set_default_rads(show_exclusive=self.config['exclusive'])
+        self.cat_cols = geometry.wedge_cols + (geometry.usage_ring_cols if self.config['usage'] else [])
+        # long tooltip text - only for recordsets that have been hovered (callback_detail)
+        chart['detail'] = ColumnDataSource(data=empty_columns(['detail_id'] + tooltips.detail_cols))
+        chart['detail'].on_change('tags', self.callback_detail)
+        formatters = {'@detail_id': CustomJSHover(args=dict(detail=chart['detail']), code=DETAIL_JS)}
+        hover = HoverTool(tooltips=tooltips.rec_tooltips(self.dataset), formatters=formatters,
+                          point_policy='follow_mouse', names=['recordset'])
+        hover_2 = HoverTool(tooltips=tooltips.cat_tooltips(self.dataset), point_policy='follow_mouse', names=['cat'])
+        hover_3 = HoverTool(tooltips=tooltips.usage_tooltips(self.dataset), formatters=formatters,
+                            point_policy='follow_mouse', names=['usage'])
+        tools = [hover, hover_2, hover_3, TapTool(), WheelZoomTool(), PanTool(), ResetTool(), SaveTool()]
+
+        # CREATE FIGURE
+        title = self.config['title'].format(month=self.dataset['month'])
+        p = figure(plot_width=width, plot_height=height, title=title,
+                   x_axis_type=None, y_axis_type=None,
+                   x_range=(-420, 420), y_range=(-420, 420),
+                   min_border=0, outline_line_color=None,
+                   background_fill_color=background,
+                   tools=tools, toolbar_location="above")
+
+        p.xgrid.grid_line_color = None
+        p.ygrid.grid_line_color = None
+        chart['figure'] = p
+        chart['rec_hover'] = hover
+        chart['cat_hover'] = hover_2
+        chart['usage_hover'] = hover_3
+
+        # add a circle to highlight with / without hints radius
+        chart['hint_circle'] = p.circle(0, 0, radius=radii['radius_3']+radii['hint_inc'], fill_alpha=0,
+                                        line_color='grey', line_alpha=0.4)
+
+        # category  wedges
+        cat_source = ColumnDataSource(data=empty_columns(self.cat_cols))
+        chart['cat'] = p.annular_wedge('centre_x', 'centre_y', 'inner', 'outer', 'start', 'end', color='color',
+                                       alpha='alpha', direction='clock', source=cat_source,
+                                       view=self.shown_view(cat_source), name='cat')
+
+        # Text creation
+        # total item count + recordset count + cat count
+        # (+ changes since the compared month, in comparison mode)
+        for count, y in [('item_count', 390), ('recordset_count', 372), ('cat_count', 354), ('change_count', 336)]:
+            chart[count] = Label(x=-400, y=y, x_offset=0, text='', text_baseline="middle", text_font_size='11pt')
+            p.add_layout(chart[count])
+
+        # recordset wedges - all categories in one renderer (single hit-test for hover & tap)
+        rec_source = ColumnDataSource(data=empty_columns(tooltips.rec_columns(self.dataset)))
+        chart['rec'] = p.annular_wedge('centre_x', 'centre_y', 'inner', 'outer', 'start', 'end', color='color',
+                                       alpha='alpha', direction='clock', source=rec_source,
+                                       view=self.shown_view(rec_source), name='recordset', line_width=0)
+
+        chart['rec'].selection_glyph = chart['rec'].glyph   # (radii switched with the usage ring - USAGE_JS)
+
+        # radial category lines
+        chart['lines'] = p.annular_wedge(0, 0, radii['radius_0'], radii['radius_3']+radii['line_inc_outer'],
+                                         'start', 'start', color="grey", source=ColumnDataSource(data={'start': []}))
+
+        # creates taptool for recordset url links - the recordset (& usage) glyphs only
+        taptool = p.select(type=TapTool)[0]
+        taptool.renderers = [chart['rec']]
+        # set taptool callback
+        taptool.callback = CustomJS(args=dict(url=tooltips.url), code=TAP_JS)
+
+        # usage ring - grid circles, category lines & bars (outer radius - usage.add_usage's usage_rad), drawn
+        # once & hidden: the usage toggle shows them in the browser
+        chart['usage'] = []
+        if self.config['usage']:
+            grid = ColumnDataSource(data={'radius': [ug_cent, ug_cent+ug_half, ug_cent-ug_half, ug_cent-(ug_half/2),
+                                                     ug_cent+(ug_half/2)],
+                                          'line_alpha': [0.9, 0.4, 0.4, 0.2, 0.2]})
+            chart['usage'].append(p.circle(0, 0, radius='radius', fill_alpha=0, line_color='grey',
+                                           line_alpha='line_alpha', source=grid))
+            chart['usage'].append(p.annular_wedge(0, 0, ug_cent-ug_half-ug_over, ug_cent+ug_half+ug_over,
+                                                  'start', 'start', color="grey", source=chart['lines'].data_source))
+            usage = p.annular_wedge('centre_x', 'centre_y', ug_cent-ug_half, 'usage_rad', 'start', 'end',
+                                    color='usage_col', alpha=0.7, direction='clock', source=rec_source,
+                                    view=self.shown_view(rec_source), name='usage', line_width=0.5)
+            usage.selection_glyph = usage.glyph
+            chart['usage'].append(usage)
+            taptool.renderers.append(usage)  # add usage renderer to renderer list for taptool
+            for renderer in chart['usage']:
+                renderer.visible = False
+            usage_radii = geometry.set_default_rads(show_usage=True, show_exclusive=self.config['exclusive'])
+            self.usage_toggle.js_on_change('active', CustomJS(
+                args=dict(toggle=self.usage_toggle, wedges=[chart['cat'], chart['rec']], ring=chart['usage'],
+                          hint=chart['hint_circle'].glyph, lines=chart['lines'].glyph, radii=radii,
+                          usage_radii=usage_radii), code=USAGE_JS))
+
+        # click controls filtered in the browser - on each click & on new chart data from the server
+        if self.config.get('client_filters'):
+            client_filter = CustomJS(args=dict(
+                rec_source=rec_source, cat_source=cat_source, lines=chart['lines'].data_source,
+                hintable=self.hintable, recordtype=self.recordtype, country=self.country,
+                item_count=chart['item_count'], recordset_count=chart['recordset_count'],
+                cat_count=chart['cat_count'], change_count=chart['change_count'], start=pi/2,
+                base_colors=geometry.base_colors, rec_colors=[geometry.color_map[x] for x in geometry.base_colors],
+                rec_alphas=geometry.rec_alphas, changed=list(geometry.change_colors)), code=CLIENT_FILTER_JS)
+            for widget in [self.hintable, self.recordtype, self.country]:
+                widget.js_on_change('active', client_filter)
+            for source in [rec_source, cat_source]:
+                source.js_on_change('data', client_filter)
+
+        return chart
+
+    def shown_view(self, source):
+        """
+        view of a chart source - only its shown wedges, for apps filtering the click controls in the browser
+        """
+        if not self.config.get('client_filters'):
+            return CDSView(source=source)
+        return CDSView(source=source, filters=[CustomJSFilter(code=SHOWN_JS)])
+
+    def client_filtered(self):
+        """
+        True if the browser filters the click controls for the current dataset (client_filters) - a country_word
+        holds up to data.max_client_countries countries
+        """
+        return bool(self.config.get('client_filters')) and len(self.dataset['country_list']) <= data.max_client_countries
+
+    def start_preset(self):
+        """
+        the country quick selection the session was opened with (?preset=<name>), None if none / unknown
+        """
+        if self.doc is None or self.doc.session_context is None or self.doc.session_context.request is None:
+            return None
+        values = self.doc.session_context.request.arguments.get('preset') or [b'']
+        name = values[0].decode('utf-8', 'replace')
+        return name if name in self.country_dropdown.options else None
+
+    def preset_countries(self, name):
+        """
+        country indexes of a country quick selection in this month's country list (data.resolve_presets)
+        """
+        return data.resolve_presets(self.dataset, self.config['country_dd'])[name]
+
+    def selection(self):
+        """
+        select_data arguments for the current widget settings (sliders in m -> items)
+        """
+        return dict(cat_min=self.cat_min.value*1000000, cat_max=self.cat_max.value*1000000,
+                    rec_min=self.recordset_min.value*1000000, rec_max=self.recordset_max.value*1000000,
+                    country=self.country.active, hintable=self.hintable.active,
+                    exclusive=self.exclusive.active if self.exclusive else 2,
+                    recordtype=self.recordtype.active, cat_select=self.cat_select.value)
+
+    def set_dataset(self, dataset):
+        """
+        switches the session to another prepared dataset (shared.get_dataset / get_comparison) & redraws
+        - keeping the ticked countries by name, as country indexes differ between files
+        """
+        selected = [self.country.labels[i] for i in self.country.active]
+        all_selected = len(selected) == len(self.country.labels)
+        self.dataset = dataset
+        self.country.labels = dataset['country_list']
+        self.country.active = [i for i, x in enumerate(dataset['country_list']) if all_selected or x in selected]
+        self.cat_select.options = dataset['cat_select_menu']
+        self.switching = True   # (no callback_4 redraw - this one redraws)
+        self.country_dropdown.options = data.available_presets(dataset, self.config['country_dd'])
+        if self.country_dropdown.value not in self.country_dropdown.options:   # (its countries are gone too)
+            self.country_dropdown.value = self.country_dropdown.options[0]
+            self.country.active = self.preset_countries(self.country_dropdown.value)
+        self.switching = False
+        self.chart['figure'].title.text = self.config['title'].format(month=dataset['month'])
+        self.chart['rec_hover'].tooltips = tooltips.rec_tooltips(dataset)
+        self.chart['cat_hover'].tooltips = tooltips.cat_tooltips(dataset)
+        self.chart['usage_hover'].tooltips = tooltips.usage_tooltips(dataset)
+        self.chart['detail'].data = empty_columns(['detail_id'] + tooltips.detail_cols)
+        self.chart['detail'].tags = []
+        if self.month_select is not None:
+            self.switching = True
+            if dataset['month'] not in self.months:   # a month loaded since the session started
+                self.months = compare.month_files(self.config['month_folders'])
+                self.month_select.options = list(self.months)
+                self.compare_select.options = ['None'] + list(self.months)
+            self.month_select.value = dataset['month']
+            self.compare_select.value = dataset.get('compare_month', 'None')
+            self.switching = False
+        self.redraw()
+
+    def month_dataset(self, month, compare_month):
+        """
+        dataset for the month selectors: the chosen month, or its comparison with the compare month
+        (loaded / joined on first use - run in the background)
+        """
+        usage = self.config['usage']
+        dataset = shared.get_dataset(self.months[month], usage)
+        if compare_month not in ['None', month]:
+            previous = shared.get_dataset(self.months[compare_month], usage)
+            dataset = shared.get_comparison(dataset, previous)
+        return dataset
+
+    def switch_dataset(self, dataset):
+        if dataset is not self.dataset:
+            self.set_dataset(dataset)
+        elif self.redraw_queued:
+            self.redraw()
+        else:
+            self.output_status.text = 'Status: Current'
+
+    def on_new_dataset(self, dataset):
+        # called from the watcher thread - document changes have to wait for the session's next tick
+        self.doc.add_next_tick_callback(partial(self.offer_dataset, dataset))
+
+    def offer_dataset(self, dataset):
+        """
+        notes a newly loaded month - the next UPDATE switches to it
+        """
+        if dataset is self.dataset:   # (session started after the swap)
+            return
+        self.pending_dataset = dataset
+        self.output_status.text = 'Status: {} data now available, press UPDATE'.format(dataset['month'])
+
+    def chart_request(self):
+        """
+        shared.chart_data arguments for the current widget settings (the usage ring's radii come with the chart
+        data - USAGE_JS)
+        """
+        radii = geometry.set_default_rads(show_exclusive=self.config['exclusive'])
+        usage_in_selection = bool(self.usage_scope and self.usage_scope.active == 1)
+        return dict(dataset=self.dataset, selection=self.selection(), radii=radii,
+                    usage_in_selection=usage_in_selection, client_filters=self.client_filtered())
+
+    def plot_chart(self):
+        """
+        updates the persistent chart's sources & labels for the current widget settings (at once - see redraw)
+        """
+        # collect df from Master df as defined by widget settings & format it - or reuse the cached result
+        request, started = self.chart_request(), time.perf_counter()
+        self.finish_redraw(request, started, metrics.collect(partial(shared.chart_data, self.config, **request)))
+
+    def redraw(self):
+        """
+        plot_chart with the data stage run in the background (in_background). while a month switch loads, the
+        redraw waits for it instead of replacing it - set_dataset redraws with the settings of the time, or
+        sync_month_selectors on the month still shown if the switch is dropped
+        """
+        if self.month_loading():
+            self.redraw_queued = True
+            return
+        self.redraw_queued = False
+        request, started = self.chart_request(), time.perf_counter()
+        self.in_background(partial(metrics.collect, partial(shared.chart_data, self.config, **request)),
+                           partial(self.finish_redraw, request, started), 'Status: Updating chart...')
+
+    def finish_redraw(self, request, started, result):
+        """
+        draws chart data (with the stage timings metrics.collect gave) & logs the redraw
+        """
+        chart_data, stages = result
+        with metrics.timed('draw'):
+            self.draw(request, chart_data)
+        metrics.record('redraw', time.perf_counter() - started)
+        dataset = request['dataset']
+        metrics.log_redraw(snapshot=os.path.basename(dataset['path']), month=dataset['month'],
+                           compare_month=dataset.get('compare_month'), selection=request['selection'],
+                           usage_in_selection=request['usage_in_selection'],
+                           cache_hit='select_data' not in stages,
+                           datasets=int(chart_data['datasets']), wedges=len(chart_data.get('rec', {}).get('start', [])),
+                           stages_ms={k: round(v*1000, 2) for k, v in stages.items()},
+                           total_ms=round((time.perf_counter() - started)*1000, 2))
+
+    def in_background(self, work, finish, status, dropped=None):
+        """
+        runs work() on the executor, then finish(result) on a later tick of the session - unless the session has
+        made a newer request meanwhile (an older one is cancelled if not started, its result dropped otherwise -
+        redraw never replaces a month switch).
+        shows status until then. dropped() is called instead of finish when the request is dropped or fails.
+        without a document, runs both at once
+        """
+        if self.doc is None:
+            finish(work())
+            return
+        self.generation += 1
+        if self.future is not None and self.future.cancel() and self.dropped is not None:
+            self.dropped()
+        self.output_status.text = status
+        self.future, self.dropped = executor.submit(work), dropped
+        self.future.add_done_callback(partial(self.on_done, self.generation, finish, dropped))
+
+    def on_done(self, generation, finish, dropped, future):
+        # called from the executor thread - document changes have to wait for the session's next tick
+        if not future.cancelled():
+            self.doc.add_next_tick_callback(partial(self.finish_background, generation, finish, dropped, future))
+
+    def finish_background(self, generation, finish, dropped, future):
+        if generation != self.generation:   # superseded
+            if dropped is not None:
+                dropped()
+            return
+        self.future = self.dropped = None
+        try:
+            result = future.result()
+        except Exception:
+            log.exception('background update failed')
+            self.output_status.text = 'Status: Update failed, press UPDATE to retry'
+            if dropped is not None:
+                dropped()
+            return
+        finish(result)
+
+    def draw(self, request, chart_data):
+        """
+        puts chart data (shared.chart_data for request) into the persistent chart's sources & labels
+        """
+        dataset = request['dataset']
+        chart = self.chart
+
+        # in case selections result in a ZERO df - empty glyphs & a '0 items' line (client_filters data keeps
+        # the recordsets the click controls hide)
+        if 'rec' not in chart_data:
+            cat_source, rec_source = empty_columns(self.cat_cols), empty_columns(tooltips.rec_columns(dataset))
+        else:
+            cat_source, rec_source = chart_data['cat'], chart_data['rec']
+        self.show_counts(chart_data)
+        chart['change_count'].text = ''
+        if 'changes' in chart_data:
+            chart['change_count'].text = ('since {}: {new:,} new, {removed:,} removed, {grown:,} grown, '
+                                          '{shrunk:,} shrunk ({delta:+,.0f} items)'
+                                          .format(dataset['compare_month'], **chart_data['changes']))
+
+        # category wedges & radial category lines
+        update_source(chart['cat'].data_source, cat_source)
+        shown = cat_source.get('shown', slice(None))
+        update_source(chart['lines'].data_source, {'start': np.asarray(cat_source['start'])[shown]})
+
+        # recordset wedges
+        update_source(chart['rec'].data_source, rec_source)
+
+        # widget setting descriptors
+        self.output_status.text = 'Status: Current'
+        hintability_list = ["Hintable", "Not hintable", "All"]
+        descriptors = ['Minimum items in category: {:,.1f}m'.format(self.cat_min.value),
+                       'Maximum items in category: {:,.1f}m'.format(self.cat_max.value),
+                       'Minimum items in record set: {:,.3f}m'.format(self.recordset_min.value),
+                       'Maximum items in record set: {:,.1f}m'.format(self.recordset_max.value),
+                       'Hintability selection: ' + hintability_list[self.hintable.active],
+                       'Active types: ' + ', '.join([data.type_list[i] for i in self.recordtype.active])]
+        for output, text in zip(self.describe_text, descriptors):
+            output.text = text
+
+    def show_counts(self, counts):
+        """
+        item, dataset & category count labels (dataset & category counts blank for an empty selection)
+        """
+        chart = self.chart
+        chart['item_count'].text = '{:,.0f} items'.format(counts['items'])
+        chart['recordset_count'].text = '{:,.0f} datasets'.format(counts['datasets']) if counts['datasets'] else ''
+        chart['cat_count'].text = '{:,.0f} categories'.format(counts['categories']) if counts['datasets'] else ''
+
+    def callback_live(self, attr, old, new):
+        # live sliders - counts for the slider values straight away, from prefix sums over the click selection
+        selection = self.selection()
+        click = {x: selection.pop(x) for x in ['country', 'hintable', 'exclusive', 'recordtype']}
+        summary = shared.summary_index(self.dataset, **click)
+        self.show_counts(data.summary_counts(self.dataset, summary, **selection))
+        self.output_status.text = 'Status: Counts updated, chart redraws when the slider is released'
+
+    def callback_settled(self, attr, old, new):
+        # live sliders - slider released: redraws settle_ms after the last release (no document - at once)
+        if self.doc is None:
+            self.plot_chart()
+            return
+        if self.settle_timeout is not None:
+            self.doc.remove_timeout_callback(self.settle_timeout)
+        self.settle_timeout = self.doc.add_timeout_callback(self.redraw_settled, settle_ms)
+
+    def redraw_settled(self):
+        self.settle_timeout = None
+        self.redraw()
+
+    def callback(self, attr, old, new):
+        # doesn't change chart - but flags the pending changes
+        self.output_status.text = 'Status: Changes Pending, press UPDATE'
+
+    def callback_click(self, attr, old, new):
+        # hintability, recordtype & country - redrawn in the browser (client_filters), else flags pending changes
+        if not self.client_filtered():
+            self.callback(attr, old, new)
+
+    def callback_2(self):
+        # UPDATER - refills the chart's sources with all the new settings (& switches to a new month, if loaded)
+        if self.pending_dataset is not None:
+            dataset, self.pending_dataset = self.pending_dataset, None
+            self.set_dataset(dataset)
+        else:
+            self.redraw()
+
+    def callback_3(self, attr, old, new):
+        # for single category selection dropdown - auto-refresh, & sets cat min/max to defaults
+        self.cat_min.value = 0
+        self.cat_max.value = 1000
+        self.redraw()
+
+    def callback_4(self, attr, old, new):
+        # for quick country selection dropdown - auto-refresh, & sets country_active to selected combo
+        if self.switching:
+            return
+        self.country.active = self.preset_countries(self.country_dropdown.value)
+        self.redraw()
+
+    def callback_7(self, attr, old, new):
+        # usage percentiles over the whole file / within the selection - auto-refresh
+        self.redraw()
+
+    def callback_detail(self, attr, old, new):
+        # hovered recordsets (detail source tags, set by DETAIL_JS) - sends their long tooltip text, once each.
+        # tags come from the browser - anything but a row number is ignored
+        master = self.dataset['master']
+        ids = list(dict.fromkeys(x for x in new if isinstance(x, int) and not isinstance(x, bool) and x not in old
+                                 and 0 <= x < len(master)))
+        if ids:
+            self.chart['detail'].stream({col: master[col].values[ids].tolist() if col in master.columns
+                                         else [''] * len(ids) for col in ['detail_id'] + tooltips.detail_cols})
+
+    def callback_6(self, attr, old, new):
+        # month & compare month selection - auto-refresh with the chosen month (or comparison)
+        if self.switching:
+            return
+        month, compare_month = self.month_select.value, self.compare_select.value
+        self.month_request = self.generation + 1   # (in_background's generation for it)
+        self.in_background(partial(self.month_dataset, month, compare_month), self.switch_dataset,
+                           'Status: Loading {}...'.format(month), self.sync_month_selectors)
+
+    def sync_month_selectors(self):
+        """
+        shows the month (& compare month) of the dataset actually loaded in the month selectors again, after a
+        month switch was dropped - unless a newer month switch is on its way (that one sets them)
+        """
+        if self.month_select is None or self.month_loading():
+            return
+        self.switching = True
+        self.month_select.value = self.dataset['month']
+        self.compare_select.value = self.dataset.get('compare_month', 'None')
+        self.switching = False
+        if self.redraw_queued:
+            self.redraw()
+
+    def month_loading(self):
+        # True while the latest background request is a month switch (callback_6)
+        return self.future is not None and self.month_request == self.generation
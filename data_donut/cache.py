@@ -0,0 +1,74 @@
+"""
+bounded LRU cache of formatted chart data (category & recordset column dicts) & live slider summary
+indexes (shared.summary_index), shared by every session in the server process
+
+Keys are normalized widget-state tuples that start with the dataset's snapshot_id, so a new
+snapshot never hits entries built from an old one (and clear() drops them all at once).
+Cached column dicts are shared between sessions - use them to build / replace ColumnDataSource
+data, never patch / stream into them in place.
+"""
+import threading
+from collections import OrderedDict
+
+max_entries = 128
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get(key):
+    """
+    cached value for key (None if missing) - marks it most recently used
+    """
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return _entries[key]
+        _stats['misses'] += 1
+        return None
+
+
+def put(key, value):
+    """
+    stores value for key, evicting the least recently used entries beyond max_entries
+    """
+    with _lock:
+        _entries[key] = value
+        _entries.move_to_end(key)
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+    return value
+
+
+def get_or_build(key, build):
+    """
+    cached value for key, or build() it (outside the lock) & cache it
+    """
+    value = get(key)
+    if value is None:
+        value = put(key, build())
+    return value
+
+
+def invalidate(snapshot_id):
+    """
+    drops entries built from one snapshot
+    """
+    with _lock:
+        for key in [x for x in _entries if x[0] == snapshot_id]:
+            del _entries[key]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def stats():
+    """
+    hits, misses & current size
+    """
+    with _lock:
+        return dict(_stats, size=len(_entries))
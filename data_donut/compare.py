@@ -0,0 +1,103 @@
+"""
+month-over-month comparison of two donut snapshots
+
+prepare_comparison joins two prepared datasets on dataset_orig and returns a dataset of the same
+shape as data.prepare_dataset's, so select_data, the filter index & geometry work on it unchanged:
+every recordset of either month, its wedge sized by the larger of its two event counts (category totals,
+texts & the category size sliders use the current month's items), with per-recordset deltas (prev_events, events_now, events_delta) and a change class - new, removed, grown, shrunk or
+unchanged. shared.get_comparison caches these per snapshot pair.
+"""
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_donut import data, formatting, snapshot
+
+changes = ['new', 'removed', 'grown', 'shrunk', 'unchanged']
+
+
+def month_files(folders):
+    """
+    OrderedDict of month label -> df_output_for_donut_MMYY.pkl path over the folders, newest month first
+    (a month in more than one folder is taken from the first)
+    """
+    months = {}
+    for folder in folders:
+        for path in snapshot.month_pickles(folder):
+            months.setdefault(snapshot.file_month(path), os.path.abspath(path))
+    return OrderedDict((snapshot.month_label(months[x]), months[x]) for x in sorted(months, reverse=True))
+
+
+def signed_count(values):
+    """
+    '+5,812' / '-120' change strings
+    """
+    values = np.asarray(values, dtype=float)
+    return np.where(values < 0, '-', '+').astype(object) + formatting.grouped_string(np.abs(values), 0)
+
+
+def join_months(current, previous):
+    """
+    outer join of two formatted master dfs on dataset_orig (data.dataset_keys): every current row (with its
+    previous events) then the previous month's removed rows (current columns only). returns the joined df with
+    events_now, prev_events, events_delta, change & change_text added - and events set to the larger count
+    (wedge angles & the recordset size sliders - everything else counts events_now)
+    """
+    cur_keys, prev_keys = data.dataset_keys(current), data.dataset_keys(previous)
+    prev_pos = prev_keys.get_indexer(cur_keys)          # -1 - new this month
+    removed = np.setdiff1d(np.arange(len(previous)), prev_pos[prev_pos >= 0])
+
+    df = pd.concat([current.reset_index(drop=True),
+                    data.take_rows(previous, removed).reindex(columns=current.columns).reset_index(drop=True)],
+                   ignore_index=True)
+    n_cur = len(current)
+    events_now = np.concatenate([current['events'].values, np.zeros(len(removed))])
+    prev_events = np.concatenate([np.where(prev_pos >= 0, previous['events'].values[prev_pos], 0),
+                                  previous['events'].values[removed]]).astype(float)
+    delta = events_now - prev_events
+
+    is_new = np.concatenate([prev_pos == -1, np.zeros(len(removed), dtype=bool)])
+    is_removed = np.arange(len(df)) >= n_cur
+    change = np.select([is_new, is_removed, delta > 0, delta < 0], changes[:4], default='unchanged')
+    df['events_now'] = events_now
+    df['prev_events'] = prev_events
+    df['events_delta'] = delta
+    df['events'] = np.maximum(events_now, prev_events)
+    df['change'] = change.astype(object)
+    df['str_from_events'] = formatting.millions_string(events_now)
+    df['change_text'] = (df['change'] + ': ' + formatting.millions_string(prev_events) + ' -> '
+                         + df['str_from_events'] + ' items (' + signed_count(delta) + ')')
+    return df
+
+
+def change_summary(df):
+    """
+    count of recordsets per change class & the net change in items for a (selected) comparison df
+    """
+    counts = df['change'].value_counts()
+    summary = {x: int(counts.get(x, 0)) for x in changes}
+    summary['delta'] = df['events_delta'].sum()
+    return summary
+
+
+def prepare_comparison(current, previous):
+    """
+    comparison dataset of two prepared datasets (current month vs previous) - a dataset dict as
+    data.prepare_dataset's, with 'compare_month' & a ('compare', ...) snapshot_id added
+    """
+    joined = join_months(current['master'], previous['master'])
+    df, cat_df, country_list, country_bits, cat_select_menu = data.format_cat_and_master(joined, formatted=True)
+    if 'cat_sparkline' in current['cat_master_df'].columns:   # history sparklines (of the current month)
+        cat_df['cat_sparkline'] = current['cat_master_df']['cat_sparkline'].reindex(cat_df.index).fillna('').values
+    comparison = {'master': df, 'cat_master_df': cat_df, 'country_list': country_list,
+                  'cat_select_menu': cat_select_menu, 'usage': current['usage'],
+                  'filter_index': data.build_filter_index(df, cat_df, country_bits),
+                  'snapshot_id': ('compare', current['snapshot_id'], previous['snapshot_id']),
+                  'path': current['path'], 'month': current['month'], 'compare_month': previous['month'],
+                  **data.country_lookup(country_list)}
+    for key in ['sparkline_months', 'sparkline_stamp']:
+        if key in current:
+            comparison[key] = current[key]
+    return comparison
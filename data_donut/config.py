@@ -0,0 +1,77 @@
+"""
+settings for each donut app - the entry point scripts build a data_donut.app.DonutApp from one
+
+    master_file        - df_output_for_donut_MMYY.pkl to show (relative to where bokeh serve runs), or None
+                         to show the newest month in data_folder
+    data_folder        - (no master_file) folder watched for new df_output_for_donut_MMYY.pkl files
+    reload_seconds     - (no master_file) how often the folder is checked - a new month is loaded in the
+                         background & swapped in without a restart (data_donut.watch)
+    title              - chart title ({month} - the data file's month, e.g. 'Sept 2024')
+    month_folders      - folders of df_output_for_donut_MMYY.pkl files offered in the month & compare month
+                         selectors (none - no selectors)
+    country_dd         - country quick selections: name -> country names (None - every country), resolved
+                         against each month's country list (data.resolve_presets)
+    usage              - usage toggle & usage ring (the file needs usage columns)
+    exclusive          - exclusivity selector, with exclusive recordsets separated from the categories
+    live_sliders       - size sliders update the counts while dragging & redraw the chart when released
+                         (otherwise they wait for UPDATE)
+    client_filters     - hintability, recordtype & country controls filter the chart in the browser, without a
+                         server round trip (sessions hold every recordset the other settings select, small
+                         ones unmerged) - for months with up to 32 countries
+    metrics_port       - port for the Prometheus /metrics endpoint (data_donut.metrics), or None - redraws are
+                         logged as JSON lines either way
+    static_folder      - folder for static pre-rendered pages of the country_dd presets (data_donut.static) -
+                         rendered whenever a new month is loaded, or None
+    app_url            - the live app's URL path, which static pages link to with ?preset=<name>
+    cat_max_end        - whole category max slider end (m)
+    recordset_max_end  - recordset max slider end (m)
+    min_wedge_degrees  - recordsets narrower than this are drawn as one 'Other N datasets' wedge per category
+                         (they would be under a pixel wide)
+"""
+
+# by name, so a month with new countries (or a different file) still gets the right ones - names a month
+# doesn't have are skipped (a preset with none of them is left out of that month's selector)
+country_presets = {'ALL': None,
+                   'UK': ['England', 'Great Britain', 'Scotland', 'UK None', 'UK Other', 'United Kingdom', 'Wales'],
+                   'UK & Ireland': ['England', 'Great Britain', 'Ireland', 'Scotland', 'UK None', 'UK Other',
+                                    'United Kingdom', 'Wales'],
+                   'Ireland': ['Ireland'],
+                   'Americas': ['Americas', 'Canada', 'Central America', 'North America', 'United States'],
+                   'Australia & NZ': ['Australasia', 'Australia', 'New Zealand'],
+                   'Asia': ['Asia']}
+
+prod = {
+    'master_file': None,
+    'data_folder': '.',
+    'reload_seconds': 60,
+    'month_folders': ['.', 'data_archive'],
+    'title': 'findmypast Datasets (at end {month})',
+    'country_dd': country_presets,
+    'usage': False,       # no usage data since 0724
+    'exclusive': False,   # exclusivity selector removed
+    'live_sliders': True,
+    'client_filters': False,
+    'metrics_port': None,
+    'static_folder': 'static_views/data_summary_prod',
+    'app_url': '/data_summary_prod',
+    'cat_max_end': 1200,
+    'recordset_max_end': 300,
+    'min_wedge_degrees': 0.1,
+}
+
+eden = {
+    'master_file': 'data_archive/df_output_for_donut_0122.pkl',
+    'title': 'EDEN - findmypast Datasets (at end {month})',
+    'month_folders': ['data_archive'],
+    'country_dd': country_presets,
+    'usage': True,
+    'exclusive': True,
+    'live_sliders': True,
+    'client_filters': False,
+    'metrics_port': None,
+    'static_folder': None,   # fixed master_file - python -m data_donut.static eden <folder>
+    'app_url': '/data_summary_prod_eden',
+    'cat_max_end': 1100,
+    'recordset_max_end': 280,   # lifted to 280 for US marriages
+    'min_wedge_degrees': 0.1,
+}
@@ -0,0 +1,354 @@
+"""
+master data preparation & selection for the donut apps
+
+prepare_dataset turns the raw master data (snapshot.read_master) into a dataset dict - the
+formatted master df, cat_master_df, country list, category menu & a bitmap filter index - and
+select_data picks the rows for a set of widget settings from it. Country quick selections are given
+by country name and resolved against each dataset's country list (resolve_presets). For apps that
+filter the click controls in the browser, each master row also carries them as bits (click_bits,
+country_word) and client_mask is the same filter on chart columns. Plain numpy / pandas, no bokeh.
+"""
+import numpy as np
+import pandas as pd
+
+from data_donut import formatting, snapshot
+from data_donut.usage import add_usage
+
+# filter values - widget index -> master values
+type_list = ['Records', 'Documents', 'Articles', 'Images']
+FILTER_INDEX_VERSION = 2   # bump when build_filter_index changes - indexes stored in snapshots are rebuilt
+max_client_countries = 32  # countries a country_word holds - months with more are filtered on the server
+yes_no_options = [['Yes'], ['No'], ['Yes', 'No']]  # Yes / No / All radio buttons
+
+def value_bitmaps(series, values):
+    """
+    returns dict of boolean arrays (bitmaps) - one per value - for a master column
+    """
+    return {value: (series == value).values for value in values}
+
+
+def build_filter_index(df, cat_df, country_bits):
+    """
+    builds the filter index for master once at load time: per-value bitmaps for each filter column,
+    the bit-packed country matrix, plus events sorted (with row order) for range lookups
+    - select_data then only ANDs bitmaps
+    """
+    index = {}
+    index['category'] = value_bitmaps(df['category'], cat_df.index)
+    index['hintable'] = value_bitmaps(df['hintable'], ['Yes', 'No'])
+    index['exclusive'] = value_bitmaps(df['exclusive'], ['Yes', 'No'])
+    index['recordtype'] = value_bitmaps(df['recordtype'], type_list)
+    index['country'] = country_bits
+    index['events_order'] = np.argsort(df['events'].values, kind='stable')
+    index['events_sorted'] = df['events'].values[index['events_order']]
+    index['category_code'] = cat_df.index.get_indexer(df['category'])   # row -> cat_df position
+    index['rows'] = df.shape[0]
+    return index
+
+
+def country_mask(country_bits, country, n_countries):
+    """
+    bitmap of rows whose source countries include any of the (index) selected countries
+    """
+    selected = np.zeros(n_countries, dtype=bool)
+    selected[list(country)] = True
+    return (country_bits & np.packbits(selected)).any(axis=1)
+
+
+def country_lookup(country_list):
+    """
+    a dataset's country parts: 'country_index' (country name -> bit in the country matrix), & the empty caches
+    resolve_presets fills - 'country_masks' (sorted country indexes -> row bitmap) & 'country_presets'
+    """
+    return {'country_index': {name: i for i, name in enumerate(country_list)}, 'country_masks': {},
+            'country_presets': {}}
+
+
+def country_selection_mask(dataset, country):
+    """
+    bitmap of rows whose source countries include any of the (index) selected countries - a cached preset
+    mask when there is one (no countries ticked matches everything, as the empty regex always did)
+    """
+    filter_index = dataset['filter_index']
+    if len(country) == 0:
+        return np.ones(filter_index['rows'], dtype=bool)
+    mask = dataset.get('country_masks', {}).get(tuple(sorted(set(country))))
+    if mask is None:
+        mask = country_mask(filter_index['country'], country, len(dataset['country_list']))
+    return mask
+
+
+def resolve_presets(dataset, presets):
+    """
+    country indexes of each country quick selection (name -> country names, None for every country) in the
+    dataset's country list - names the month doesn't have are skipped. the presets' row bitmaps are cached in
+    the dataset on first use, so selecting a preset is a lookup. returns {preset: indexes} - empty for a preset
+    none of whose countries the month has (see available_presets)
+    """
+    key = tuple((name, None if names is None else tuple(names)) for name, names in presets.items())
+    resolved = dataset['country_presets'].get(key)
+    if resolved is None:
+        country_index = dataset['country_index']
+        resolved = {}
+        for name, names in presets.items():
+            country = sorted(country_index.values() if names is None
+                             else {country_index[x] for x in names if x in country_index})
+            if country:
+                mask = country_selection_mask(dataset, country)
+                mask.flags.writeable = False   # (shared by every session, as the dataset)
+                dataset['country_masks'][tuple(country)] = mask
+            resolved[name] = country
+        dataset['country_presets'][key] = resolved
+    return resolved
+
+
+def available_presets(dataset, presets):
+    """
+    the country quick selections the dataset has countries for - a preset resolving to no countries would
+    select everything (no countries ticked), so it is left out
+    """
+    resolved = resolve_presets(dataset, presets)
+    return [name for name in presets if len(resolved[name])]
+
+
+def any_of(bitmaps, keys, rows):
+    """
+    ORs together the bitmaps for keys (all False if no keys)
+    """
+    mask = np.zeros(rows, dtype=bool)
+    for key in keys:
+        mask |= bitmaps[key]
+    return mask
+
+
+def events_range(index, low, high):
+    """
+    (start, stop) positions in the sorted events array of rows with low < events < high
+    """
+    return (int(np.searchsorted(index['events_sorted'], low, side='right')),
+            int(np.searchsorted(index['events_sorted'], high, side='left')))
+
+
+def events_range_mask(index, low, high):
+    """
+    bitmap of rows with low < events < high, from the sorted events array
+    """
+    start, stop = events_range(index, low, high)
+    mask = np.zeros(index['rows'], dtype=bool)
+    mask[index['events_order'][start:stop]] = True
+    return mask
+
+
+def selected_categories(dataset, cat_min, cat_max, cat_select='ALL'):
+    """
+    list of categories selected by the whole category size sliders, or the single category view
+    """
+    cat_master_df = dataset['cat_master_df']
+    if cat_select == 'ALL':
+        return list(cat_master_df.loc[(cat_master_df['events'] >= cat_min)
+                                      & (cat_master_df['events'] <= cat_max)].index)
+    return [x for x in [cat_select.lower()] if x in dataset['filter_index']['category']]
+
+
+def click_mask(dataset, country, hintable=2, exclusive=2, recordtype=[0, 1, 2, 3]):
+    """
+    bitmap of the rows selected by the click controls - hintability, exclusivity, recordtype & countries
+    (everything but the size sliders & category)
+    """
+    filter_index = dataset['filter_index']
+    rows = filter_index['rows']
+
+    # hintability & exclusivity masks (radio button index -> values)
+    hint_mask = any_of(filter_index['hintable'], yes_no_options[hintable], rows)
+    excl_mask = any_of(filter_index['exclusive'], yes_no_options[exclusive], rows)
+
+    # recordtype mask
+    rec_type_mask = any_of(filter_index['recordtype'], [type_list[i] for i in recordtype], rows)
+
+    # country mask (cached for the country quick selections)
+    cntry_mask = country_selection_mask(dataset, country)
+
+    return hint_mask & excl_mask & rec_type_mask & cntry_mask
+
+
+def click_bits(df):
+    """
+    the click control values of each master row as bits, for filtering in the browser: 1 - hintable,
+    2 - not hintable, 4 << recordtype index
+    """
+    bits = np.where(df['hintable'].values == 'Yes', 1, 0) | np.where(df['hintable'].values == 'No', 2, 0)
+    for i, name in enumerate(type_list):
+        bits |= np.where(df['recordtype'].values == name, 4 << i, 0)
+    return bits.astype(np.uint8)
+
+
+def country_words(country_bits, n_countries):
+    """
+    each row's source countries as one uint32 (bit i - country i), for filtering in the browser - the first
+    max_client_countries countries of the bit-packed country matrix
+    """
+    member = np.unpackbits(country_bits, axis=1)[:, :min(n_countries, max_client_countries)].astype(np.uint64)
+    return (member << np.arange(member.shape[1], dtype=np.uint64)).sum(axis=1).astype(np.uint32)
+
+
+def client_mask(columns, country, hintable=2, recordtype=[0, 1, 2, 3]):
+    """
+    click_mask on chart columns (click_bits & country_word - geometry.client_cols): bitmap of the recordsets
+    the hintability, recordtype & country controls select, as the browser computes it
+    """
+    bits = columns['click_bits']
+    types = sum(4 << i for i in recordtype)
+    mask = ((bits & [1, 2, 3][hintable]) > 0) & ((bits & types) > 0)
+    if len(country):
+        mask &= (columns['country_word'] & sum(1 << i for i in country)) > 0
+    return mask
+
+
+def select_data(dataset, cat_min, cat_max, rec_min, rec_max, country, hintable=2, exclusive=2,
+                recordtype=[0, 1, 2, 3], cat_select='ALL'):
+    """
+    takes inputs from all widgets, combines bitmaps from the dataset's filter_index and selects
+    relevant data from its master df
+    """
+    filter_index = dataset['filter_index']
+    rows = filter_index['rows']
+
+    # cat size mask
+    cat_list = selected_categories(dataset, cat_min, cat_max, cat_select)
+    cat_mask = any_of(filter_index['category'], cat_list, rows)
+
+    # recordset size mask
+    rec_mask = events_range_mask(filter_index, rec_min, rec_max)
+
+    # combining them all
+    return take_rows(dataset['master'], cat_mask & rec_mask & click_mask(dataset, country, hintable, exclusive,
+                                                                         recordtype))
+
+
+def take_rows(df, rows):
+    """
+    df's rows for a bitmap / row positions, column by column - df.loc & df.iloc consolidate df's columns
+    first, which would copy a snapshot's memory-mapped arrays into the process
+    """
+    rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else rows
+    return pd.DataFrame({col: df[col].values[rows] for col in df.columns}, index=df.index[rows], copy=False)
+
+
+def summary_index(dataset, mask):
+    """
+    prefix sums for instant slider counts over the rows in mask (see click_mask) - compact, one entry per
+    row in mask: 'keys' - the rows as category code * (rows + 1) + sorted events position, ascending (so each
+    category's rows are one run, in events order), & 'items' - the cumulative items over them (0 first)
+    """
+    filter_index = dataset['filter_index']
+    order = filter_index['events_order']
+    master = dataset['master']
+    items = master['events_now' if 'events_now' in master.columns else 'events'].values   # (comparison data)
+    positions = np.flatnonzero(mask[order])
+    keys = filter_index['category_code'][order][positions].astype(np.int64) * (filter_index['rows'] + 1) + positions
+    by_key = np.argsort(keys, kind='stable')
+    return {'keys': keys[by_key], 'items': np.r_[0, np.cumsum(items[order][positions][by_key].astype(float))]}
+
+
+def summary_counts(dataset, summary, cat_min, cat_max, rec_min, rec_max, cat_select='ALL'):
+    """
+    items, datasets & categories the sliders & category select give, from a summary_index - without
+    selecting any rows. returns dict as the counts in geometry.build_chart_data's chart data
+    """
+    start, stop = events_range(dataset['filter_index'], rec_min, rec_max)
+    stop = max(start, stop)   # (min slider above max - nothing selected)
+    cats = dataset['cat_master_df'].index.get_indexer(selected_categories(dataset, cat_min, cat_max, cat_select))
+    base = cats.astype(np.int64) * (dataset['filter_index']['rows'] + 1)
+    low, high = np.searchsorted(summary['keys'], base + start), np.searchsorted(summary['keys'], base + stop)
+    count = high - low
+    items = summary['items'][high] - summary['items'][low]
+    return {'items': items.sum(), 'datasets': int(count.sum()), 'categories': int((count > 0).sum())}
+
+
+def format_cat_and_master(df, countries=None, country_bits=None, formatted=False, usage=False):
+    """
+    initial edits & configs on master df and creation of cat_master_df
+    (a snapshot is already formatted, and brings its country bitset: countries & country_bits)
+    """
+    if not formatted:
+        df = formatting.format_master(df)  # display columns - normally done when the snapshot is built
+    # (grouping the events series, not the frame - a frame groupby consolidates its columns, copying the
+    # memory-mapped snapshot arrays). comparison data (compare.join_months) totals the current month's items -
+    # its events are the larger of both months' counts, for the wedge angles only
+    items = df['events_now' if 'events_now' in df.columns else 'events']
+    df_2 = items.groupby(df['category'], observed=True).sum().to_frame('events')
+
+    # add usage radius and color data to master df (only for apps showing usage)
+    if usage and 'ftv_ratio_scaled' in df.columns:
+        df = add_usage(df)
+
+    # dataset x country membership (bit-packed, exact tokens), and the sorted country list from its columns
+    if country_bits is None:
+        country_bits, country_list = snapshot.country_tokens(df['source_country_list'])
+    else:
+        country_list = countries
+
+    cat_select_menu = [x.title() for x in df_2.index]
+    cat_select_menu.insert(0, 'ALL')
+
+    # row position - the recordset tooltips look up their long text columns by it (data_donut.tooltips)
+    df['detail_id'] = np.arange(len(df))
+
+    # click controls as bits - for apps filtering them in the browser (client_mask)
+    df['click_bits'] = click_bits(df)
+    df['country_word'] = country_words(country_bits, len(country_list))
+
+    return df, df_2, country_list, country_bits, cat_select_menu
+
+
+def dataset_keys(df):
+    """
+    identifies master rows across months: dataset_orig, plus the part number where one dataset_orig has
+    several rows (datasets split in parts), numbered in 'dataset' order. returns a MultiIndex
+    """
+    order = np.argsort(df['dataset'].values, kind='stable')
+    part = np.empty(len(df), dtype=int)
+    orig = df['dataset_orig'].values[order]
+    part[order] = pd.Series(orig).groupby(orig).cumcount().values   # (not df.iloc - that consolidates df)
+    return pd.MultiIndex.from_arrays([df['dataset_orig'].values, part], names=['dataset_orig', 'part'])
+
+
+def selection_key(dataset, cat_min, cat_max, rec_min, rec_max, country, hintable=2, exclusive=2,
+                  recordtype=[0, 1, 2, 3], cat_select='ALL', min_angle=0, usage_in_selection=False,
+                  client_filters=False, radii=None, usage_radii=None):
+    """
+    normalized widget-state tuple for the chart data cache - slider values are reduced to the categories
+    / sorted events positions they select, so any settings giving the same chart share one entry (& the
+    history store version its sparklines came from - a dataset reloaded with new sparklines never hits
+    entries of the old one). radii & usage_radii - the ring settings of the app drawing it
+    (geometry.set_default_rads), as apps differing in them get different wedges
+    """
+    rings = tuple(None if x is None else tuple(sorted(x.items())) for x in [radii, usage_radii])
+    return (dataset['snapshot_id'], dataset['usage'], dataset.get('sparkline_stamp'),
+            tuple(selected_categories(dataset, cat_min, cat_max, cat_select)),
+            events_range(dataset['filter_index'], rec_min, rec_max), tuple(sorted(set(country))), hintable,
+            exclusive, tuple(sorted(set(recordtype))), min_angle, usage_in_selection, client_filters, rings)
+
+
+def prepare_dataset(raw, usage=False):
+    """
+    formats raw master data (from snapshot.read_master) & builds its filter index. returns dict of dataset parts
+    - run once per server process by shared.get_dataset, then shared (read-only) by all sessions
+    """
+    df, cat_df, country_list, country_bits, cat_select_menu = format_cat_and_master(raw['frame'], raw['countries'],
+                                                                                    raw['country_bits'],
+                                                                                    raw['formatted'], usage)
+
+    # bitmap filter index for select_data - memory-mapped from the snapshot, once the first process has stored it
+    folder = raw.get('folder')
+    filter_index = snapshot.read_index(folder, FILTER_INDEX_VERSION) if folder else None
+    if filter_index is None:
+        filter_index = build_filter_index(df, cat_df, country_bits)
+        if folder:
+            try:
+                snapshot.write_index(folder, filter_index, FILTER_INDEX_VERSION)
+            except OSError:   # read-only data folder - every process builds its own
+                pass
+    return {'master': df, 'cat_master_df': cat_df, 'country_list': country_list,
+            'cat_select_menu': cat_select_menu, 'usage': usage, 'filter_index': filter_index,
+            **country_lookup(country_list)}
@@ -0,0 +1,96 @@
+"""
+display-string formatting for the donut master data
+
+format_master runs once per snapshot (at snapshot build time, or on load when reading a plain
+pickle) and adds every display column the tooltips use, so redraws never format strings again.
+Number formatting is vectorized with numpy char functions.
+"""
+import numpy as np
+
+title_fixes = {'Us': 'US', 'Uk': 'UK', "'S": "'s"}
+url_chars = str.maketrans({',': '', "'": '', '(': '', ')': '', '&': 'and', ' ': '-'})
+
+
+def grouped_string(values, decimals):
+    """
+    formats numbers as '{:,.<decimals>f}' strings (object array) - numpy formatting, with the
+    thousands separators added only for the (few) values that need them
+    """
+    values = np.asarray(values, dtype=float)
+    text = np.char.mod('%.{}f'.format(decimals), values).astype(object)
+    int_part = np.char.partition(text.astype(str), '.')[..., 0]
+    needs_commas = np.char.str_len(np.char.lstrip(int_part, '-')) > 3
+    text[needs_commas] = ['{:,.{}f}'.format(x, decimals) for x in values[needs_commas]]
+    return text
+
+
+def millions_string(values, decimals=(1, 2, 3)):
+    """
+    formats counts as readable friendly strings in m - decimals for values over 10m, over 1m, else
+    """
+    m = np.asarray(values, dtype=float) / 1000000
+    text = np.where(m > 10, grouped_string(m, decimals[0]),
+                    np.where(m > 1, grouped_string(m, decimals[1]), grouped_string(m, decimals[2])))
+    return text + ' m'
+
+
+def event_string(df, col='events'):
+    """
+    formats event count as readable friendly string in m
+    """
+    df['str_from_events'] = millions_string(df[col].values)
+    return df
+
+
+def dataset_title(df):
+    """
+    formats dataset title field from dataset name
+    """
+    df['dataset_title'] = df['dataset'].str.title().str.replace('|'.join(title_fixes),
+                                                                lambda m: title_fixes[m.group(0)], regex=True)
+    return df
+
+
+def dataset_url(df):
+    """
+    creates dataset url suffix
+    """
+    #use dataset_orig to avoid the (dataset_part notation causing issues)
+    df['dataset_url'] = (df['dataset_orig'].str.translate(url_chars)
+                         .str.replace(r'(vols?)\.', r'\1', regex=True))  # vol. added for Gilbert Family History (vol. 6)
+    return df
+
+
+def percentile_string(values):
+    """
+    formats 0-1 percentiles as whole percent strings
+    """
+    return np.char.mod('%.0f', np.asarray(values, dtype=float)*100).astype(object)
+
+
+def usage_strings(df):
+    """
+    usage tooltip strings (percentiles, first time views & view indexes)
+    """
+    df['usage_perc'] = percentile_string(df['ftv_ratio_scaled'].values)
+    df['usage_perc_totv'] = percentile_string(df['totv_ratio_scaled'].values)
+    df['str_from_ftv'] = millions_string(df['ft_view'].values, decimals=(0, 2, 3))
+    df['ftv_index'] = grouped_string(df['ftv_ratio'].values*1000, 3)
+    df['totv_index'] = grouped_string(df['totv_ratio'].values*1000, 3)
+    return df
+
+
+def format_master(df):
+    """
+    renames & adds all display columns to a raw master df
+    """
+    df = df.rename(columns={'hintable?': 'hintable'})
+    df = event_string(df)
+    df = dataset_title(df)
+    df = dataset_url(df)
+    df['source_country_list'] = df['source_country_list'].str.title().str.replace('Uk', 'UK')
+    df['recordtype'] = df['recordtype'].str.title()
+    df['cat_title'] = df['category'].str.title()
+    if 'ftv_ratio_scaled' in df.columns:   # usage data (not in every month's file)
+        df = usage_strings(df)
+    return df
@@ -0,0 +1,348 @@
+"""
+donut wedge geometry & chart column data for a selection of master rows
+
+Plain numpy / pandas - the column dicts built here are the ColumnDataSource data the bokeh app
+(data_donut.app) puts into its long-lived sources. For apps filtering the click controls in the browser,
+client_layout lays out chart data of every recordset for the ones the controls show - the same
+arithmetic as the app's CLIENT_FILTER_JS, which redoes it on each click.
+"""
+from math import pi
+
+import numpy as np
+import pandas as pd
+
+from data_donut import compare, data, metrics, usage
+from data_donut.formatting import event_string, millions_string
+
+# bokeh.palettes.Category20b[20] - listed here so the data modules never import bokeh
+category20b = ['#393b79', '#5254a3', '#6b6ecf', '#9c9ede', '#637939', '#8ca252', '#b5cf6b', '#cedb9c',
+               '#8c6d31', '#bd9e39', '#e7ba52', '#e7cb94', '#843c39', '#ad494a', '#d6616b', '#e7969c',
+               '#7b4173', '#a55194', '#ce6dbd', '#de9ed6']
+
+base_colors = [col for i, col in enumerate(category20b) if i % 2 == 0]    # takes alternate colors in palette Category20b
+rec_alphas = [0.9, 0.6]
+color_map = {i: j for i, j in zip(base_colors, [col for i, col in enumerate(category20b) if i % 2 == 1])}  # maps alternate colors to 'next step' color
+
+# recordset colors in comparison mode (unchanged recordsets keep their category color)
+change_colors = {'new': '#1a9641', 'grown': '#a6d96a', 'shrunk': '#fdae61', 'removed': '#d7191c'}
+
+# columns every wedge glyph source needs
+wedge_cols = ['centre_x', 'centre_y', 'inner', 'outer', 'start', 'end', 'color', 'alpha']
+
+# wedge radii with the usage ring shown (usage apps) - the browser switches the wedge glyphs to these
+usage_ring_cols = ['inner_usage', 'outer_usage']
+
+# recordset columns build_chart_data needs whichever columns are sent (merging & comparison colors)
+merge_cols = ['events', 'events_now', 'events_delta', 'change']
+
+# recordset columns the browser lays the chart out from when it filters the click controls (client_layout)
+client_cols = ['events', 'events_now', 'events_delta', 'change', 'cat_rank', 'click_bits', 'country_word']
+
+# merged ('other N datasets') wedges: columns summed over their recordsets, & the text of columns whose
+# recordsets differ ('' for any other)
+merged_sums = ['size', 'events', 'events_now', 'prev_events', 'events_delta', 'ft_view', 'tot_view']
+merged_text = {'recordtype': 'Mixed', 'hintable': 'Mixed', 'exclusive': 'Mixed', 'usage_col': None}
+
+
+def set_default_rads(show_usage=False, show_exclusive=False):
+    """
+    Defines chart radii for with / without usage variants (exclusive recordsets are separated from
+    the category ring only when the app shows exclusivity). returns dict of radii params
+    """
+    radii = {}
+    if show_usage == True:
+        radii['radius_0'] = 60
+        radii['radius_1'] = 70
+        radii['radius_2'] = 150
+        radii['radius_3'] = 250
+        radii['hint_inc'] = 10
+        radii['excl_inc'] = 8
+        radii['line_inc_outer'] = 20
+    elif show_usage == False:
+        radii['radius_0'] = 80
+        radii['radius_1'] = 100
+        radii['radius_2'] = 200
+        radii['radius_3'] = 350
+        radii['hint_inc'] = 10
+        radii['excl_inc'] = 8 if show_exclusive else 0
+        radii['line_inc_outer'] = 20
+    return radii
+
+
+def ring_radii(radii, n_cats, exclusive, hintable):
+    """
+    category & recordset inner / outer radius columns for a set of radii (exclusive & hintable - recordset
+    bool arrays). returns the category & recordset dicts
+    """
+    return ({'inner': np.full(n_cats, radii['radius_1']), 'outer': np.full(n_cats, radii['radius_2'])},
+            {'inner': radii['radius_2'] + radii['excl_inc']*exclusive,
+             'outer': radii['radius_3'] + radii['hint_inc']*hintable})
+
+
+def donut_geometry(df, radii, start=pi/2, usage_radii=None):
+    """
+    computes all wedge geometry for the selected rows in one vectorized pass: categories ranked by
+    total events, recordsets sorted (category rank, events desc), and every start / end / mid angle
+    (clockwise from start, from one cumulative sum), inner / outer radius, color & alpha - and the
+    radii with the usage ring shown (usage_ring_cols) for usage_radii. category 'events' are the current
+    month's items (events_now) in comparison data, whose events only size the wedges.
+    returns dict of 'cat' and 'rec' column arrays & the row 'order' of df
+    """
+    categories, cat_of_row = np.unique(df['category'].values, return_inverse=True)
+    events = df['events'].values.astype(float)
+    cat_events = np.bincount(cat_of_row, weights=events, minlength=len(categories))
+    cat_items = cat_events
+    if 'events_now' in df.columns:   # (compare.join_months data)
+        cat_items = np.bincount(cat_of_row, weights=df['events_now'].values.astype(float), minlength=len(categories))
+
+    # rank categories by events (desc) & order rows by (category rank, events desc)
+    cat_order = np.argsort(-cat_events, kind='stable')
+    rank = np.empty_like(cat_order)
+    rank[cat_order] = np.arange(len(cat_order))
+    order = np.lexsort((-events, rank[cat_of_row]))
+    row_rank = rank[cat_of_row][order]
+    row_events = events[order]
+
+    # angles - recordsets tile their category, so both come from cumulative sums over the same total
+    scale = (pi*2) / events.sum()
+    cat_end = np.cumsum(cat_events[cat_order])
+    rec_end = np.cumsum(row_events)
+    cat = {'category': categories[cat_order], 'events': cat_items[cat_order],
+           'size': cat_events[cat_order]*scale,
+           'start': start - (cat_end - cat_events[cat_order])*scale, 'end': start - cat_end*scale}
+    rec = {'size': row_events*scale, 'start': start - (rec_end - row_events)*scale, 'end': start - rec_end*scale,
+           'cat_rank': row_rank.astype(np.int32)}
+
+    # position of each recordset within its category - alternates recordset alphas
+    first_in_cat = np.searchsorted(row_rank, row_rank, side='left')
+    within = np.arange(len(order)) - first_in_cat
+
+    n_cats, n_recs = len(categories), len(order)
+    exclusive, hintable = df['exclusive'].values[order] == 'Yes', df['hintable'].values[order] == 'Yes'
+    cat_colors = np.array(base_colors, dtype=object)[np.arange(n_cats) % len(base_colors)]
+    rec_colors = np.array([color_map[x] for x in base_colors], dtype=object)
+    cat.update({'centre_x': np.zeros(n_cats), 'centre_y': np.zeros(n_cats), 'color': cat_colors,
+                'alpha': np.ones(n_cats)})
+    rec.update({'centre_x': np.zeros(n_recs), 'centre_y': np.zeros(n_recs),
+                'color': rec_colors[row_rank % len(base_colors)],
+                'alpha': np.array(rec_alphas)[within % len(rec_alphas)]})
+    for part, part_radii in zip([cat, rec], ring_radii(radii, n_cats, exclusive, hintable)):
+        part.update(part_radii)
+    if usage_radii is not None:
+        for part, part_radii in zip([cat, rec], ring_radii(usage_radii, n_cats, exclusive, hintable)):
+            part.update({col + '_usage': values for col, values in part_radii.items()})
+    for part in [cat, rec]:
+        part['mid'] = (part['start'] + part['end'])/2  # added for any need to draw centre lines in wedges
+
+    return {'cat': cat, 'rec': rec, 'order': order}
+
+
+def cat_title(df):
+    """
+    formats a category title field from index (cat_df)
+    """
+    df['cat_title'] = df.index.str.title()
+    return df
+
+
+def format_cat_df(geometry, cat_info=None):
+    """
+    category df (indexed by category) from the donut geometry, with display text & any extra per-category
+    columns in cat_info (a df indexed by category) added
+    """
+    df = pd.DataFrame(geometry['cat']).set_index('category')
+    df = event_string(df)
+    df = cat_title(df)
+    if cat_info is not None:
+        for col in cat_info.columns:
+            df[col] = cat_info[col].reindex(df.index).values
+    return df
+
+
+def create_rec_df_dict(geometry, used_data, columns=None):
+    """
+    creates the formatted recordset columns for all categories - merged (in category order)
+    into one dict of columns, for a single recordset glyph. columns - the used_data columns to include
+    (default all)
+    """
+    columns = used_data.columns if columns is None else [x for x in columns if x in used_data.columns]
+    rec_data = {col: used_data[col].values[geometry['order']] for col in columns}
+    rec_data.update(geometry['rec'])
+    return rec_data  # one dict of columns (CDS data)
+
+
+def merge_small_wedges(rec_data, categories, radii, min_angle, usage_radii=None):
+    """
+    level of detail: replaces the recordsets narrower than min_angle (radians) in each category - 2 or more
+    of them - by one 'other N datasets' wedge spanning them. categories - each row's category (rows are in
+    category order, largest recordsets first, so the small ones are the tail of each category). rec_data needs
+    size & events (& events_now, events_delta in comparison data). returns the new dict of columns
+    (rec_data itself when nothing is merged)
+    """
+    new_cat = np.r_[True, categories[1:] != categories[:-1]]
+    run = np.cumsum(new_cat) - 1
+    small = rec_data['size'] < min_angle
+    merge = small & (np.bincount(run[small], minlength=run[-1] + 1)[run] > 1)
+    if not merge.any():
+        return rec_data
+
+    rows = np.flatnonzero(merge)
+    groups, first = np.unique(run[rows], return_index=True)   # first - each group's first position in rows
+    last = np.r_[first[1:], len(rows)] - 1
+    n = np.diff(np.r_[first, len(rows)])
+
+    merged = {}
+    for col, values in rec_data.items():
+        values = np.asarray(values)
+        if col in merged_sums:
+            merged[col] = np.add.reduceat(np.nan_to_num(values[rows].astype(float)), first)
+            continue
+        same = np.logical_and.reduceat(values[rows] == values[rows][first].repeat(n), first)
+        if values.dtype == object:
+            merged[col] = np.where(same, values[rows][first], np.array([merged_text.get(col, '')], dtype=object))
+        else:
+            merged[col] = np.where(same, values[rows][first], np.nan)
+    merged['start'] = rec_data['start'][rows][first]
+    merged['end'] = rec_data['end'][rows][last]
+    merged['mid'] = (merged['start'] + merged['end'])/2
+    merged['inner'] = np.full(len(groups), radii['radius_2'])
+    merged['outer'] = np.full(len(groups), radii['radius_3'])
+    if usage_radii is not None:
+        merged['inner_usage'] = np.full(len(groups), usage_radii['radius_2'])
+        merged['outer_usage'] = np.full(len(groups), usage_radii['radius_3'])
+    merged['alpha'] = rec_data['alpha'][rows][first]
+    merged['dataset_title'] = np.array(['Other {:,} datasets'.format(x) for x in n], dtype=object)
+    if 'dataset_url' in merged:
+        merged['dataset_url'] = np.full(len(groups), '', dtype=object)   # (no search page - TAP_JS skips them)
+    if 'str_from_events' in merged:
+        merged['str_from_events'] = millions_string(merged['events_now' if 'events_now' in merged else 'events'])
+    if 'change_text' in merged:
+        merged['change_text'] = 'net ' + compare.signed_count(merged['events_delta']) + ' items'
+
+    # merged wedges take the place of their first recordset
+    keep = np.flatnonzero(~merge)
+    order = np.argsort(np.r_[keep, rows[first]], kind='stable')
+    return {col: np.concatenate([np.asarray(values)[keep], merged[col]])[order] for col, values in rec_data.items()}
+
+
+def df_columns(df):
+    """
+    dict of columns (CDS data) from a df - its index as a column first, as ColumnDataSource.from_df
+    """
+    data = {df.index.name or 'index': df.index.values}
+    data.update({col: df[col].values for col in df.columns})
+    return data
+
+
+def build_chart_data(used_data, radii, cat_info=None, rec_columns=None, min_angle=0, usage_radii=None):
+    """
+    formats category & recordset column dicts (+ counts) for the chart from the selected data
+    (cat_info - extra category columns, see format_cat_df). rec_columns - the recordset columns to send
+    (default all), min_angle - recordsets narrower than this are merged (see merge_small_wedges),
+    usage_radii - the radii with the usage ring shown, for usage_ring_cols
+    """
+    comparing = 'change' in used_data.columns   # (compare.prepare_comparison data)
+    chart_data = {'items': used_data['events_now' if comparing else 'events'].sum(), 'datasets': used_data.shape[0]}
+    if comparing:
+        chart_data['changes'] = compare.change_summary(used_data)
+    if used_data.shape[0] == 0:
+        return chart_data
+
+    # all category & recordset wedge geometry in one pass, then the category df
+    with metrics.timed('donut_geometry'):
+        geometry = donut_geometry(used_data, radii, usage_radii=usage_radii)
+    with metrics.timed('format_cat_df'):
+        cat_df = format_cat_df(geometry, cat_info)
+    chart_data['cat'] = df_columns(cat_df)
+    chart_data['categories'] = cat_df.shape[0]
+
+    # create recordset columns - all the recordsets, grouped by category (small ones merged)
+    with metrics.timed('create_rec_df_dict'):
+        rec = create_rec_df_dict(geometry, used_data, None if rec_columns is None else list(rec_columns) + merge_cols)
+    if min_angle:
+        with metrics.timed('merge_small_wedges'):
+            rec = merge_small_wedges(rec, used_data['category'].values[geometry['order']], radii, min_angle,
+                                     usage_radii)
+    if comparing:
+        colors = pd.Series(rec['change']).map(change_colors).values
+        rec['color'] = np.where(pd.isna(colors), rec['color'], colors)
+    chart_data['rec'] = rec if rec_columns is None else {col: rec[col] for col in rec_columns if col in rec}
+    return chart_data
+
+
+def dataset_chart_data(dataset, selection, radii, rec_columns=None, min_angle=0, usage_in_selection=False,
+                       usage_radii=None):
+    """
+    chart data for a dataset & select_data arguments - with the dataset's per-category columns beyond its
+    events totals (e.g. history sparklines) in the category data. usage_in_selection - usage percentiles
+    within the selection (usage.selection_usage) rather than the whole file
+    """
+    cat_info = dataset['cat_master_df'].drop(columns='events')
+    with metrics.timed('select_data'):
+        used_data = data.select_data(dataset, **selection)
+    if usage_in_selection and 'ftv_ratio' in used_data.columns:
+        with metrics.timed('selection_usage'):
+            used_data = usage.selection_usage(used_data)
+    return build_chart_data(used_data, radii, cat_info if len(cat_info.columns) else None, rec_columns, min_angle,
+                            usage_radii)
+
+
+def client_layout(chart_data, shown, start=pi/2):
+    """
+    chart data of every recordset (build_chart_data with client_cols, nothing merged) laid out for only the
+    shown ones (data.client_mask) - categories re-ranked & recordsets re-tiled over the shown events, with
+    their colours, alphas, event text & the counts. Hidden recordsets & emptied categories keep their columns
+    (shown False), so the browser can bring them back without the server - CLIENT_FILTER_JS does the same
+    arithmetic there. returns new chart data (the cached one is never changed)
+    """
+    if chart_data['datasets'] == 0:
+        return chart_data
+    rec, cat = dict(chart_data['rec']), dict(chart_data['cat'])
+    cat_rank = rec['cat_rank']
+    events = np.where(shown, rec['events'].astype(float), 0)
+    items = np.where(shown, np.nan_to_num(rec['events_now' if 'events_now' in rec else 'events'].astype(float)), 0)
+    cat_events = np.bincount(cat_rank, weights=events, minlength=len(cat['start']))
+    cat_items = np.bincount(cat_rank, weights=items, minlength=len(cat['start']))   # (see donut_geometry)
+    cat_shown = cat_events > 0
+
+    # shown categories ranked by their shown events (desc), each spanning its share of the circle
+    cat_order = np.argsort(-cat_events, kind='stable')[:cat_shown.sum()]
+    rank = np.zeros(len(cat_events), dtype=int)
+    rank[cat_order] = np.arange(len(cat_order))
+    offset = np.zeros(len(cat_events))
+    offset[cat_order] = np.r_[0, np.cumsum(cat_events[cat_order])[:-1]]
+    scale = (pi*2) / events.sum() if cat_shown.any() else 0
+    cat_colors = np.array(base_colors, dtype=object)[rank % len(base_colors)]
+    for col, values in {'start': start - offset*scale, 'end': start - (offset + cat_events)*scale,
+                        'color': cat_colors, 'events': cat_items, 'str_from_events': millions_string(cat_items),
+                        'size': cat_events*scale}.items():
+        if col in cat:
+            cat[col] = np.where(cat_shown, values, cat[col])
+    if 'mid' in cat:
+        cat['mid'] = np.where(cat_shown, (cat['start'] + cat['end'])/2, cat['mid'])
+    cat['shown'] = cat_shown
+
+    # shown recordsets tile their category in row order (largest first) - running sums within each category
+    by_cat = np.argsort(cat_rank, kind='stable')
+    first = np.searchsorted(cat_rank[by_cat], cat_rank[by_cat], side='left')
+    cum_events, cum_shown = np.cumsum(events[by_cat]), np.cumsum(shown[by_cat])
+    end, within = np.empty(len(events)), np.empty(len(events), dtype=int)
+    end[by_cat] = offset[cat_rank[by_cat]] + cum_events - np.r_[0, cum_events][first]
+    within[by_cat] = cum_shown - np.r_[0, cum_shown][first] - 1
+    rec_colors = np.array([color_map[x] for x in base_colors], dtype=object)[rank[cat_rank] % len(base_colors)]
+    recolor = shown & ~np.isin(rec['change'], list(change_colors)) if 'change' in rec else shown
+    for col, values in {'start': start - (end - events)*scale, 'end': start - end*scale, 'size': events*scale,
+                        'alpha': np.array(rec_alphas)[within % len(rec_alphas)]}.items():
+        if col in rec:
+            rec[col] = np.where(shown, values, rec[col])
+    if 'mid' in rec:
+        rec['mid'] = np.where(shown, (rec['start'] + rec['end'])/2, rec['mid'])
+    rec['color'] = np.where(recolor, rec_colors, rec['color'])
+    rec['shown'] = shown
+
+    counts = {'items': items.sum(), 'datasets': int(shown.sum()), 'categories': int(cat_shown.sum())}
+    if 'changes' in chart_data:
+        changed = pd.Series(rec['change'][shown]).value_counts()
+        counts['changes'] = {x: int(changed.get(x, 0)) for x in compare.changes}
+        counts['changes']['delta'] = np.nansum(rec['events_delta'][shown])
+    return dict(chart_data, cat=cat, rec=rec, **counts)
@@ -0,0 +1,168 @@
+"""
+long-format time series of every monthly donut file, for growth sparklines
+
+build_store reads every df_output_for_donut_MMYY.pkl in the given folders (through its snapshot
+when current) and writes one columnar store in the snapshot format (donut_history.donut), with a
+row per (month, dataset): events, category, recordtype, hintable, exclusive and the usage columns
+(NaN for months without usage data). Text columns are dictionary-encoded and rows are sorted by
+dataset then month, so each dataset's history is one contiguous range. Datasets are matched
+across months by data.dataset_keys (dataset_orig & part).
+
+add_sparklines runs when a dataset is loaded: it puts an events sparkline - one character per
+month, up to the dataset's own month - on each master row ('sparkline') and each category
+('cat_sparkline'), so tooltips show growth without reading any other month's file. Build with:
+
+    python -m data_donut.history [folders ...]      # default: repo root & data_archive
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_donut import compare, data, snapshot
+
+store_path = 'donut_history.donut'   # relative to where bokeh serve runs, as the data files
+default_folders = ['.', 'data_archive']
+
+usage_cols = ['ft_view', 'tot_view', 'ftv_ratio_scaled', 'totv_ratio_scaled']
+categorical = ['dataset_orig', 'category', 'recordtype', 'hintable', 'exclusive']
+spark_chars = np.array(list(' ▁▂▃▄▅▆▇█'))  # ' ' - not in that month
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def month_number(path):
+    """
+    month of a data file as yyyymm (None if its name has no MMYY)
+    """
+    month = snapshot.file_month(path)
+    return month[0]*100 + month[1] if month else None
+
+
+def number_label(month):
+    """
+    display label of a yyyymm month ('Sept 2024')
+    """
+    return '{} {}'.format(snapshot.month_names[month % 100 - 1], month // 100)
+
+
+def month_rows(path):
+    """
+    the store rows (one per dataset) of one data file
+    """
+    raw = snapshot.read_master(path, columns=['dataset', 'dataset_orig', 'events', 'category', 'recordtype',
+                                              'hintable', 'hintable?', 'exclusive'] + usage_cols)
+    df = raw['frame'].rename(columns={'hintable?': 'hintable'})
+    keys = data.dataset_keys(df)
+    rows = pd.DataFrame({'month': np.full(len(df), month_number(path), dtype=np.int32),
+                         'dataset_orig': keys.get_level_values(0), 'part': keys.get_level_values(1).astype(np.int16),
+                         'events': df['events'].values.astype(np.int64), 'category': df['category'].values,
+                         'recordtype': df['recordtype'].str.title().values, 'hintable': df['hintable'].values,
+                         'exclusive': df['exclusive'].values})
+    for col in usage_cols:
+        rows[col] = df[col].values.astype(float) if col in df.columns else np.nan
+    return rows
+
+
+def build_store(folders=default_folders, path=store_path):
+    """
+    writes the store for every month in folders (replacing any existing one). returns its path
+    """
+    months = compare.month_files(folders)
+    df = pd.concat([month_rows(x) for x in months.values()], ignore_index=True)
+    df = df.sort_values(['dataset_orig', 'part', 'month'], kind='stable').reset_index(drop=True)
+    return snapshot.write_snapshot(df, path, categorical=categorical)
+
+
+def get_store(path=store_path):
+    """
+    the loaded store (None if it hasn't been built): dict of the 'frame', its sorted 'months' (yyyymm),
+    dataset 'keys' & each row's 'key_code' - reloaded when the store is rebuilt
+    """
+    meta = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta):
+        return None
+    stamp = snapshot.source_stamp(meta)
+    with _lock:
+        store = _stores.get(os.path.abspath(path))
+        if store is None or store['stamp'] != stamp:
+            frame = snapshot.read_snapshot(path)['frame']
+            key_code, keys = pd.factorize(pd.MultiIndex.from_arrays([frame['dataset_orig'].values,
+                                                                     frame['part'].values]))
+            store = {'frame': frame, 'months': np.unique(frame['month'].values), 'keys': keys,
+                     'key_code': key_code, 'stamp': stamp}
+            _stores[os.path.abspath(path)] = store
+        return store
+
+
+def update_store(folders=default_folders, path=store_path):
+    """
+    rebuilds the store if a month in folders is missing from it. returns True if rebuilt
+    """
+    store = get_store(path)
+    months = {month_number(x) for x in compare.month_files(folders).values()}
+    if store is not None and months <= set(store['months']):
+        return False
+    build_store(folders, path)
+    return True
+
+
+def sparkline_strings(values, present):
+    """
+    one sparkline string per row of a rows x months events matrix - each row scaled between its own min & max
+    (a flat row is mid height), blank where not present
+    """
+    low = np.where(present, values, np.inf).min(axis=1, keepdims=True)
+    high = np.where(present, values, -np.inf).max(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        level = np.where(high > low, 1 + np.round((values - low) / (high - low) * 7), 4)
+    chars = spark_chars[np.where(present, level, 0).astype(int)]
+    return np.array([''.join(x) for x in chars], dtype=object)
+
+
+def add_sparklines(dataset, month, path=store_path):
+    """
+    adds 'sparkline' (master) & 'cat_sparkline' (cat_master_df) events sparklines over the store's months up to
+    month (yyyymm), plus the 'sparkline_months' labels they span & the 'sparkline_stamp' of the store version
+    (part of chart cache keys). does nothing without a store
+    """
+    store = get_store(path)
+    if store is None or month is None or not (store['months'] <= month).any():
+        return dataset
+    frame, months = store['frame'], store['months'][store['months'] <= month]
+    rows = frame['month'].values <= month
+    month_pos = np.searchsorted(months, frame['month'].values[rows])
+    events = frame['events'].values[rows].astype(float)
+
+    # datasets x months
+    values = np.zeros((len(store['keys']), len(months)))
+    present = np.zeros(values.shape, dtype=bool)
+    values[store['key_code'][rows], month_pos] = events
+    present[store['key_code'][rows], month_pos] = True
+    master = dataset['master']
+    pos = store['keys'].get_indexer(data.dataset_keys(master))
+    lines = sparkline_strings(values[pos], present[pos] & (pos >= 0)[:, None])
+    master['sparkline'] = lines
+
+    # categories x months (each month's own category for a dataset)
+    cat_df = dataset['cat_master_df']
+    cat_pos = cat_df.index.get_indexer(frame['category'].values[rows])
+    known = cat_pos >= 0
+    cat_values = np.zeros((len(cat_df), len(months)))
+    np.add.at(cat_values, (cat_pos[known], month_pos[known]), events[known])
+    cat_df['cat_sparkline'] = sparkline_strings(cat_values, cat_values > 0)
+
+    dataset['sparkline_months'] = (number_label(months[0]), number_label(months[-1]))
+    dataset['sparkline_stamp'] = tuple(store['stamp'])
+    return dataset
+
+
+def main(folders):
+    print('{} -> {}'.format(', '.join(folders), build_store(folders)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or default_folders)
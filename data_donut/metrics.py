@@ -0,0 +1,146 @@
+"""
+lightweight timings & counters for a donut server process - pipeline stages, sessions & chart cache hits
+
+Hot-path stages are timed with `with metrics.timed('select_data'):` - adding to the process's per-stage
+histogram and to the stages of the redraw running on that thread (collect). The app logs every redraw as
+one JSON line on the data_donut.metrics logger (stage timings, widget selection, month, cache hit), and
+with an app config metrics_port, serves the process totals as Prometheus text (GET /metrics):
+
+    donut_stage_seconds{stage=...}      - histogram per stage (select_data, donut_geometry, format_cat_df,
+                                          create_rec_df_dict, merge_small_wedges, selection_usage,
+                                          client_layout, draw, redraw, load_dataset, prepare_comparison)
+    donut_sessions_open / _total        - browser sessions
+    donut_chart_cache_{hits,misses}     - chart data cache (data_donut.cache)
+
+Under bokeh serve --num-procs only the first process gets the port - use the log lines there.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from data_donut import cache
+
+log = logging.getLogger(__name__)
+
+buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]   # histogram bounds (seconds)
+
+_stages = {}    # stage -> count, sum & per-bucket counts (last - over the largest bound)
+_sessions = {'open': 0, 'total': 0}
+_server = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def record(stage, seconds):
+    """
+    adds one duration of a stage (to the running redraw's stages too, if collecting)
+    """
+    with _lock:
+        entry = _stages.setdefault(stage, {'count': 0, 'sum': 0.0, 'buckets': [0] * (len(buckets) + 1)})
+        entry['count'] += 1
+        entry['sum'] += seconds
+        entry['buckets'][bisect_left(buckets, seconds)] += 1
+    stages = getattr(_local, 'stages', None)
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def collect(work):
+    """
+    runs work() - returns its result & the {stage: seconds} timed on this thread meanwhile
+    """
+    _local.stages = {}
+    try:
+        return work(), _local.stages
+    finally:
+        _local.stages = None
+
+
+def session_opened():
+    with _lock:
+        _sessions['open'] += 1
+        _sessions['total'] += 1
+
+
+def session_closed():
+    with _lock:
+        _sessions['open'] -= 1
+
+
+def log_redraw(**fields):
+    """
+    one JSON log line for a redraw
+    """
+    if log.isEnabledFor(logging.INFO):
+        log.info(json.dumps(dict(event='redraw', **fields), default=str))
+
+
+def prometheus_text():
+    """
+    the process's stage histograms, session counts & cache stats in the Prometheus text format
+    """
+    with _lock:
+        stages = {k: dict(v, buckets=list(v['buckets'])) for k, v in _stages.items()}
+        sessions = dict(_sessions)
+    stats = cache.stats()
+    lines = ['# TYPE donut_stage_seconds histogram']
+    for stage, entry in sorted(stages.items()):
+        cumulative = 0
+        for bound, count in zip(buckets + ['+Inf'], entry['buckets']):
+            cumulative += count
+            lines.append('donut_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, cumulative))
+        lines.append('donut_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(stage, entry['sum']))
+        lines.append('donut_stage_seconds_count{{stage="{}"}} {}'.format(stage, entry['count']))
+    lines += ['# TYPE donut_sessions_open gauge', 'donut_sessions_open {}'.format(sessions['open']),
+              '# TYPE donut_sessions_total counter', 'donut_sessions_total {}'.format(sessions['total']),
+              '# TYPE donut_chart_cache_hits_total counter', 'donut_chart_cache_hits_total {}'.format(stats['hits']),
+              '# TYPE donut_chart_cache_misses_total counter',
+              'donut_chart_cache_misses_total {}'.format(stats['misses']),
+              '# TYPE donut_chart_cache_entries gauge', 'donut_chart_cache_entries {}'.format(stats['size'])]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):   # (scrapes aren't worth a log line each)
+        pass
+
+
+def serve(port):
+    """
+    starts the /metrics endpoint on a daemon thread - once per process. returns False if the port is taken
+    """
+    with _lock:
+        if port in _server:
+            return _server[port] is not None
+        try:
+            _server[port] = ThreadingHTTPServer(('', port), MetricsHandler)
+        except OSError:   # e.g. another bokeh serve --num-procs worker has it
+            log.info('metrics port %s in use - not serving metrics from this process', port)
+            _server[port] = None
+            return False
+    threading.Thread(target=_server[port].serve_forever, daemon=True, name='data_donut metrics').start()
+    return True
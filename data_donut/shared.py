@@ -0,0 +1,188 @@
+"""
+process-wide store of prepared (formatted & indexed) donut datasets
+
+bokeh serve re-runs the app script top to bottom for every browser session, but modules it
+imports are only imported once per server process. Datasets loaded through get_dataset are
+therefore unpickled & formatted once, then handed to every session as the same read-only objects
+- as are the month-over-month comparisons (compare.prepare_comparison) of recently used month pairs.
+"""
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from math import radians
+
+import numpy as np
+
+from data_donut import cache, compare, data, geometry, history, metrics, snapshot, tooltips
+
+max_comparisons = 8
+
+_datasets = {}
+_comparisons = OrderedDict()   # most recently used last
+_lock = threading.Lock()       # held for the dict lookups only - loads wait on their key's lock in _building
+_building = {}                 # key -> lock held while that dataset / comparison is built
+
+
+def freeze(value):
+    """
+    marks numpy arrays (also inside dicts / lists) read-only so no session can change shared data
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            freeze(item)
+    return value
+
+
+def snapshot_id(path):
+    """
+    identifies the version of a data file: its path & the size / mtime of the pickle (or snapshot)
+    """
+    source = path if os.path.exists(path) else os.path.join(snapshot.snapshot_dir(path), 'meta.json')
+    return (path, tuple(snapshot.source_stamp(source)))
+
+
+def load_dataset(path, usage=False):
+    """
+    reads & prepares (data.prepare_dataset) the dataset for the pickle at path - from its columnar snapshot
+    when current - with usage radius / colour columns if usage. 'snapshot_id' (for cache keys), the
+    file 'path' and its display 'month' are added, with growth sparklines from the history store if it has been
+    built (history.add_sparklines). always loads - see get_dataset
+    """
+    path = os.path.abspath(path)
+    with metrics.timed('load_dataset'):
+        dataset = data.prepare_dataset(snapshot.read_master(path), usage)
+        history.add_sparklines(dataset, history.month_number(path))
+    dataset['snapshot_id'] = snapshot_id(path)
+    dataset['path'] = path
+    dataset['month'] = snapshot.month_label(path)
+    return freeze(dataset)
+
+
+def build_once(store, key, build):
+    """
+    store[key], built with build() on first use - concurrent first users of a key wait for the one build
+    rather than all building, while other keys' lookups & builds go ahead
+    """
+    with _lock:
+        if key in store:
+            return store[key]
+        lock = _building.setdefault(key, threading.Lock())
+    with lock:
+        with _lock:
+            if key in store:   # (built while waiting)
+                return store[key]
+        try:
+            value = build()
+        finally:
+            with _lock:
+                _building.pop(key, None)
+        with _lock:
+            return store.setdefault(key, value)   # (put_dataset may have stored a newer one meanwhile)
+
+
+def get_dataset(path, usage=False):
+    """
+    returns the prepared dataset for the pickle at path (see load_dataset), loading it on first use only.
+    sessions must treat the returned DataFrames as read-only - select their rows with data.take_rows (df.loc
+    / .copy() would copy the memory-mapped snapshot columns into the session)
+    """
+    return build_once(_datasets, (os.path.abspath(path), usage), partial(load_dataset, path, usage))
+
+
+def put_dataset(dataset):
+    """
+    stores a dataset loaded off the request path (load_dataset), replacing any copy of the same file
+    - later get_dataset calls return it
+    """
+    with _lock:
+        _datasets[(dataset['path'], dataset['usage'])] = dataset
+
+
+def drop_dataset(dataset):
+    """
+    forgets a dataset & its cached chart data (sessions still showing it keep their reference)
+    """
+    with _lock:
+        if _datasets.get((dataset['path'], dataset['usage'])) is dataset:
+            del _datasets[(dataset['path'], dataset['usage'])]
+    cache.invalidate(dataset['snapshot_id'])
+
+
+def get_comparison(current, previous):
+    """
+    returns the month-over-month comparison dataset (compare.prepare_comparison) of two prepared datasets,
+    joining them on first use only - the last max_comparisons pairs are kept
+    """
+    key = (current['snapshot_id'], previous['snapshot_id'], current['usage'], current.get('sparkline_stamp'))
+    comparison = build_once(_comparisons, key, partial(join_comparison, current, previous))
+    with _lock:
+        if key in _comparisons:
+            _comparisons.move_to_end(key)
+        while len(_comparisons) > max_comparisons:
+            _comparisons.popitem(last=False)
+    return comparison
+
+
+def join_comparison(current, previous):
+    """
+    compare.prepare_comparison, frozen (timed as prepare_comparison)
+    """
+    with metrics.timed('prepare_comparison'):
+        return freeze(compare.prepare_comparison(current, previous))
+
+
+def chart_data(config, dataset, selection, radii, usage_in_selection=False, client_filters=False):
+    """
+    chart data (geometry.dataset_chart_data) for a dataset & select_data arguments as an app config draws it
+    - only the recordset columns its tooltips use, wedges under min_wedge_degrees merged, and for a usage
+    dataset the wedge radii with the usage ring shown too - through the cache. usage_in_selection - usage
+    percentiles within the selection. client_filters - for a browser filtering the click controls: every
+    recordset the other settings select (none merged, with geometry.client_cols) is cached & laid out for
+    the click controls after (geometry.client_layout)
+    """
+    min_angle = radians(config.get('min_wedge_degrees', 0))
+    usage_radii = None
+    if dataset['usage']:
+        usage_radii = geometry.set_default_rads(show_usage=True, show_exclusive=config['exclusive'])
+    usage_in_selection = bool(dataset['usage'] and usage_in_selection)
+    columns, built = tooltips.rec_columns(dataset), selection
+    if client_filters:
+        min_angle = 0
+        columns = columns + geometry.client_cols
+        built = dict(selection, country=[], hintable=2, recordtype=list(range(len(data.type_list))))
+    key = data.selection_key(dataset, min_angle=min_angle, usage_in_selection=usage_in_selection,
+                             client_filters=client_filters, radii=radii, usage_radii=usage_radii, **built)
+    chart = cache.get_or_build(key, lambda: geometry.dataset_chart_data(dataset, built, radii, columns, min_angle,
+                                                                        usage_in_selection, usage_radii))
+    if client_filters and chart['datasets']:
+        click = {x: selection[x] for x in ['country', 'hintable', 'recordtype'] if x in selection}
+        with metrics.timed('client_layout'):
+            chart = geometry.client_layout(chart, data.client_mask(chart['rec'], **click))
+    return chart
+
+
+def summary_index(dataset, country, hintable=2, exclusive=2, recordtype=[0, 1, 2, 3]):
+    """
+    data.summary_index for a dataset's click control settings (live slider counts) - through the cache, so
+    sessions on the same settings share one
+    """
+    key = (dataset['snapshot_id'], 'summary', tuple(sorted(set(country))), hintable, exclusive,
+           tuple(sorted(set(recordtype))))
+    return cache.get_or_build(key, lambda: freeze(data.summary_index(
+        dataset, data.click_mask(dataset, country, hintable, exclusive, recordtype))))
+
+
+def clear():
+    """
+    drops all loaded datasets & cached chart data (next get_dataset reloads from disk)
+    """
+    with _lock:
+        _datasets.clear()
+        _comparisons.clear()
+    cache.clear()
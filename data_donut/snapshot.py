@@ -0,0 +1,367 @@
+"""
+columnar, memory-mappable snapshot format for the monthly df_output_for_donut_MMYY.pkl files
+
+A snapshot is a directory next to its pickle (df_output_for_donut_MMYY.donut) holding:
+    meta.json         - row count, source pickle stamp, column list & kinds, categorical values, countries,
+                        and whether the display columns (formatting.format_master) are included
+    <col>.npy         - numeric columns (int / float), loaded with mmap_mode='r'
+    <col>.codes.npy   - dictionary-encoded categoricals (values listed in meta.json, -1 = NaN)
+    <col>.text.npy    - other text columns as one '\\x00' separated utf-8 byte array
+    <col>.valid.npy   - (text columns with NaNs only) False where the value is NaN
+    countries.npy     - source country bitset: rows x countries, bit-packed along the country axis
+    filter_index/     - (added by the first server process to load the snapshot) its filter index
+                        (data.build_filter_index) - see write_index
+
+Numeric columns, categorical codes, the country bitset & filter index are memory-mapped on load (the
+master frame is built with copy=False over them, categoricals from their codes), so server workers
+(bokeh serve --num-procs) share them through the OS page cache. Text & list columns are decoded into
+each process's own object arrays. Converted snapshots are stored formatted -
+with all display columns precomputed - so loading them needs no string formatting. Convert with:
+
+    python -m data_donut.snapshot df_output_for_donut_0924.pkl data_archive/*.pkl
+"""
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # (windows - no multi-process serving, so no locking needed)
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from data_donut import formatting
+
+FORMAT_VERSION = 2
+SUFFIX = '.donut'
+INDEX_DIR = 'filter_index'
+
+categorical_cols = ['category', 'cat_title', 'recordtype', 'hintable?', 'hintable', 'exclusive']
+country_col = 'source_country_list'
+
+file_pattern = re.compile(r'df_output_for_donut_(\d\d)(\d\d)\.pkl$')
+month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'June', 'July', 'Aug', 'Sept', 'Oct', 'Nov', 'Dec']
+
+_ROW_SEP = '\x00'
+_ITEM_SEP = '\x1f'  # between items of list columns (e.g. metadataid_list)
+
+
+def snapshot_dir(path):
+    """
+    snapshot directory for a pickle path (df_output_for_donut_0924.pkl -> df_output_for_donut_0924.donut)
+    """
+    return os.path.splitext(path)[0] + SUFFIX
+
+
+def file_month(path):
+    """
+    (year, month) of a df_output_for_donut_MMYY.pkl path, None for other file names
+    """
+    match = file_pattern.search(os.path.basename(path))
+    if match is None or not 1 <= int(match.group(1)) <= 12:
+        return None
+    return 2000 + int(match.group(2)), int(match.group(1))
+
+
+def month_label(path):
+    """
+    display month of a data file ('Sept 2024'), '' if its name has no MMYY
+    """
+    month = file_month(path)
+    return '{} {}'.format(month_names[month[1] - 1], month[0]) if month else ''
+
+
+def month_pickles(folder):
+    """
+    the df_output_for_donut_MMYY.pkl files in folder
+    """
+    return [x for x in glob.glob(os.path.join(folder, 'df_output_for_donut_*.pkl')) if file_month(x)]
+
+
+def newest_pickle(folder):
+    """
+    latest month's df_output_for_donut_MMYY.pkl in folder (by MMYY, not file time), None if there are none
+    """
+    paths = month_pickles(folder)
+    return max(paths, key=file_month) if paths else None
+
+
+def source_stamp(path):
+    """
+    size & mtime of the source pickle - a snapshot is current while these match
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _file_name(col):
+    return re.sub(r'\W', '_', col)
+
+
+def _column_kind(series, categorical):
+    """
+    how a column is stored: numeric / categorical / text / list
+    """
+    if series.dtype.kind in 'iufb':
+        return 'numeric'
+    if series.name in categorical:
+        return 'categorical'
+    values = series.dropna()
+    if values.map(lambda x: isinstance(x, list)).all() and len(values) == len(series):
+        return 'list'
+    if values.map(lambda x: isinstance(x, str)).all():
+        return 'text'
+    raise ValueError('column {} has values that cannot be stored in a snapshot'.format(series.name))
+
+
+def _save_text(folder, name, strings, valid):
+    joined = _ROW_SEP.join(strings)
+    if joined.count(_ROW_SEP) != max(len(strings) - 1, 0):
+        raise ValueError('text column {} contains NUL characters'.format(name))
+    np.save(os.path.join(folder, name + '.text.npy'), np.frombuffer(joined.encode('utf-8'), dtype=np.uint8))
+    if not valid.all():
+        np.save(os.path.join(folder, name + '.valid.npy'), valid)
+
+
+def country_tokens(series):
+    """
+    bit-packed rows x countries membership from comma separated country strings. returns (bits, countries)
+    """
+    dummies = series.fillna('').str.get_dummies(sep=', ')
+    return np.packbits(dummies.values.astype(bool), axis=1), list(dummies.columns)
+
+
+def write_snapshot(df, folder, source=None, formatted=False, categorical=None):
+    """
+    writes master df as a columnar snapshot directory (replacing any existing one) - dictionary-encoding the
+    categorical columns (default categorical_cols)
+    """
+    if not isinstance(df.index, pd.RangeIndex):
+        raise ValueError('snapshots only store frames with a default RangeIndex')
+    tmp = folder + '.tmp-{}'.format(os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    meta = {'version': FORMAT_VERSION, 'rows': int(df.shape[0]), 'columns': [],
+            'source': source_stamp(source) if source else None, 'formatted': formatted}
+    for col in df.columns:
+        series = df[col]
+        kind = _column_kind(series, categorical_cols if categorical is None else categorical)
+        name = _file_name(col)
+        entry = {'name': col, 'file': name, 'kind': kind}
+        if kind == 'numeric':
+            np.save(os.path.join(tmp, name + '.npy'), series.values)
+        elif kind == 'categorical':
+            codes, values = pd.factorize(series, sort=True)
+            dtype = np.int8 if len(values) < 127 else np.int16 if len(values) < 32767 else np.int32
+            np.save(os.path.join(tmp, name + '.codes.npy'), codes.astype(dtype))
+            entry['values'] = list(values)
+        elif kind == 'text':
+            valid = series.notna().values
+            _save_text(tmp, name, list(series.fillna('')), valid)
+        elif kind == 'list':
+            _save_text(tmp, name, [_ITEM_SEP.join(x) for x in series], np.ones(len(series), dtype=bool))
+        meta['columns'].append(entry)
+
+    if country_col in df.columns:
+        bits, countries = country_tokens(df[country_col])
+        np.save(os.path.join(tmp, 'countries.npy'), bits)
+        meta['countries'] = countries
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    # swap in the complete directory, so readers never see a half-written snapshot
+    if os.path.isdir(folder):
+        old = folder + '.old-{}'.format(os.getpid())
+        os.rename(folder, old)
+        os.rename(tmp, folder)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.rename(tmp, folder)
+    return folder
+
+
+def convert(path):
+    """
+    converts one df_output_for_donut pickle to its (formatted) snapshot directory
+    """
+    df = formatting.format_master(pd.read_pickle(path))
+    return write_snapshot(df, snapshot_dir(path), source=path, formatted=True)
+
+
+def _load(folder, name):
+    return np.load(os.path.join(folder, name), mmap_mode='r')
+
+
+def _load_text(folder, name, rows):
+    if rows == 0:
+        return []
+    return _load(folder, name + '.text.npy').tobytes().decode('utf-8').split(_ROW_SEP)
+
+
+def read_meta(folder):
+    """
+    reads (and version checks) a snapshot's meta.json
+    """
+    with open(os.path.join(folder, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['version'] != FORMAT_VERSION:
+        raise ValueError('snapshot {} is format version {}, expected {}'.format(folder, meta['version'],
+                                                                                  FORMAT_VERSION))
+    return meta
+
+
+def read_snapshot(folder, columns=None):
+    """
+    loads a snapshot directory (only the given columns, if any). returns dict with the master 'frame'
+    (columns in the original order), the raw 'countries' list, the memory-mapped 'country_bits'
+    (rows x countries, bit-packed) & the snapshot 'folder'
+    """
+    meta = read_meta(folder)
+    rows = meta['rows']
+    entries = [x for x in meta['columns'] if columns is None or x['name'] in columns]
+    data = {}
+    for entry in entries:
+        name, kind = entry['file'], entry['kind']
+        if kind == 'numeric':
+            data[entry['name']] = _load(folder, name + '.npy')
+        elif kind == 'categorical':
+            data[entry['name']] = pd.Categorical.from_codes(_load(folder, name + '.codes.npy'),   # -1 = NaN
+                                                            entry['values'])
+        elif kind == 'text':
+            values = np.array(_load_text(folder, name, rows), dtype=object)
+            if os.path.exists(os.path.join(folder, name + '.valid.npy')):
+                values[~_load(folder, name + '.valid.npy')] = np.nan
+            data[entry['name']] = values
+        elif kind == 'list':
+            data[entry['name']] = [x.split(_ITEM_SEP) if x else [] for x in _load_text(folder, name, rows)]
+
+    # copy=False - the frame's numeric columns & category codes stay memory-mapped
+    frame = pd.DataFrame(data, columns=[x['name'] for x in entries], index=pd.RangeIndex(rows), copy=False)
+    snap = {'frame': frame,
+            'countries': meta.get('countries'), 'country_bits': None, 'source': meta['source'],
+            'formatted': meta['formatted'], 'folder': folder}
+    if snap['countries'] is not None:
+        snap['country_bits'] = _load(folder, 'countries.npy')
+    return snap
+
+
+def write_index(folder, index, version):
+    """
+    stores a filter index (dict of arrays, dicts of value -> bitmap & plain values) in a snapshot directory
+    - bitmap dicts as one values x rows matrix each. a no-op if another process has stored it meanwhile, an
+    index of another version is replaced
+    """
+    target = os.path.join(folder, INDEX_DIR)
+    tmp = target + '.tmp-{}'.format(os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = {'version': version, 'entries': {}}
+    for key, value in index.items():
+        if isinstance(value, dict):
+            matrix = np.zeros((len(value), index['rows']), dtype=bool)
+            for i, bitmap in enumerate(value.values()):
+                matrix[i] = bitmap
+            np.save(os.path.join(tmp, key + '.npy'), matrix)
+            meta['entries'][key] = {'values': list(value)}
+        elif isinstance(value, np.ndarray):
+            np.save(os.path.join(tmp, key + '.npy'), value)
+            meta['entries'][key] = {}
+        else:
+            meta['entries'][key] = {'value': value}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    try:
+        os.rename(tmp, target)
+    except OSError:   # already stored
+        if read_index(folder, version) is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        old = target + '.old-{}'.format(os.getpid())   # (an older version's - processes mapping it keep their copy)
+        os.rename(target, old)
+        os.rename(tmp, target)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def read_index(folder, version):
+    """
+    the filter index stored in a snapshot directory (arrays memory-mapped), None if there is none of this version
+    """
+    path = os.path.join(folder, INDEX_DIR)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['version'] != version:
+        return None
+    index = {}
+    for key, entry in meta['entries'].items():
+        if 'value' in entry:
+            index[key] = entry['value']
+        elif 'values' in entry:
+            matrix = _load(path, key + '.npy')
+            index[key] = {value: matrix[i] for i, value in enumerate(entry['values'])}
+        else:
+            index[key] = _load(path, key + '.npy')
+    return index
+
+
+@contextmanager
+def file_lock(path):
+    """
+    holds an exclusive lock on the file at path (created if missing) - so only one server process at a time
+    converts a new month
+    """
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def is_current(folder, path):
+    """
+    True if the snapshot folder exists in this format version & was built from the pickle as it is now
+    (or the pickle is gone)
+    """
+    if not os.path.isdir(folder):
+        return False
+    try:
+        meta = read_meta(folder)
+    except ValueError:  # older format version - rebuild with the converter
+        return False
+    return not os.path.exists(path) or meta['source'] == source_stamp(path)
+
+
+def read_master(path, columns=None):
+    """
+    loads the master data for a df_output_for_donut pickle path - from its snapshot directory when that
+    is current (or the pickle is gone), else from the pickle itself. returns dict as read_snapshot
+    """
+    folder = snapshot_dir(path)
+    if is_current(folder, path):
+        return read_snapshot(folder, columns)
+    df = pd.read_pickle(path)
+    if columns is not None:
+        df = df[[x for x in df.columns if x in columns]]
+    return {'frame': df, 'countries': None, 'country_bits': None, 'source': None, 'formatted': False,
+            'folder': None}
+
+
+def main(paths):
+    for path in paths:
+        print('{} -> {}'.format(path, convert(path)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,159 @@
+"""
+static pre-rendered views of an app's country quick selections, for serving without a bokeh session
+
+render_views draws each country_dd preset (the month has countries for) with the default sliders & controls for a dataset
+and writes it as a standalone page (bokeh file_html, CDN resources) to the app config's static_folder: index.html for the first
+preset ('ALL'), <preset>.html for the others ('uk-ireland.html') and views.json listing them with the snapshot
+they show. Each page has the preset selector (switching pages in the browser) and a link that opens the live
+app on that preset (<app_url>?preset=<name>) - so the server only gets a session once a visitor changes some
+other control. The tooltips' long text is written into each page for the recordsets it shows.
+
+The prod app renders the views whenever data_donut.watch loads a new month; serve static_folder from the web
+server in front of bokeh serve. Apps with a fixed master_file are rendered by hand:
+
+    python -m data_donut.static [prod|eden] [folder]     # default: prod, its static_folder
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from bokeh.document import Document
+from bokeh.embed import file_html
+from bokeh.layouts import column, row
+from bokeh.models import CustomJS
+from bokeh.models.widgets import Button, Select
+from bokeh.resources import CDN
+
+from data_donut import config as app_configs
+from data_donut import data, shared, snapshot, tooltips
+from data_donut.app import DonutApp, empty_columns
+
+log = logging.getLogger(__name__)
+
+views_file = 'views.json'
+
+
+def page_name(name, first=False):
+    """
+    file name of a preset's page: index.html for the first preset, else its name in lower case with '-'
+    between words ('UK & Ireland' -> uk-ireland.html)
+    """
+    return 'index.html' if first else re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') + '.html'
+
+
+def live_url(config, name):
+    return '{}?preset={}'.format(config.get('app_url', ''), quote(name))
+
+
+def write_file(path, text):
+    """
+    writes text to path through a temporary file - a web server never serves a half-written page
+    """
+    tmp = '{}.tmp-{}'.format(path, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def fill_details(app):
+    """
+    puts the long tooltip text of every drawn recordset into the detail source (there's no server to ask)
+    """
+    ids = app.chart['rec'].data_source.data.get('detail_id', [])
+    app.chart['detail'].data = empty_columns(['detail_id'] + tooltips.detail_cols)
+    # (row numbers as callback_detail takes them from the browser - merged 'Other' wedges have none)
+    app.callback_detail('tags', [], [int(x) for x in ids if x == x])
+
+
+@contextmanager
+def standalone_output():
+    """
+    the pages are standalone output of a figure whose sources have server callbacks - bokeh warns of those on
+    each. drops those warnings of this thread while rendering, the server's other embed warnings still log
+    """
+    thread = threading.get_ident()
+
+    def other_threads(record):
+        return record.thread != thread or record.levelno >= logging.ERROR
+
+    logger = logging.getLogger('bokeh.embed.util')
+    logger.addFilter(other_threads)
+    try:
+        yield
+    finally:
+        logger.removeFilter(other_threads)
+
+
+def is_current(folder, dataset):
+    """
+    True if folder already has the views of this version of the dataset
+    """
+    try:
+        with open(os.path.join(folder, views_file)) as f:
+            return json.load(f)['snapshot_id'] == json.loads(json.dumps(dataset['snapshot_id']))
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def render_views(config, dataset=None, folder=None):
+    """
+    writes the page of every country_dd preset of an app config for dataset (default: the app's current one) to
+    folder (default: the config's static_folder). returns {preset: page file name}
+    """
+    folder = folder or config['static_folder']
+    app = DonutApp(config, dataset=dataset)   # no document - each redraw is drawn at once
+    dataset = app.dataset
+    presets = data.available_presets(dataset, config['country_dd'])   # (none for countries the month lacks)
+    pages = {name: page_name(name, i == 0) for i, name in enumerate(presets)}
+
+    preset_select = Select(title="Country quick selection:", value=presets[0], options=presets)
+    preset_select.js_on_change('value', CustomJS(args=dict(pages=pages),
+                                                 code="window.location.href = pages[cb_obj.value];"))
+    live = Button(label="CHANGE SELECTION (live chart)", button_type="success")
+    open_live = CustomJS(args=dict(url=live_url(config, presets[0])), code="window.location.href = url;")
+    live.js_on_click(open_live)
+    page = column(row(preset_select, live), app.chart['figure'])
+    Document().add_root(page)   # one document, re-rendered for each preset
+
+    os.makedirs(folder, exist_ok=True)
+    title = 'findmypast dataset viewer - {}'.format(dataset['month'])
+    for name in presets:
+        app.country_dropdown.value = name   # (callback_4 - draws the preset)
+        fill_details(app)
+        preset_select.value = name
+        open_live.args = dict(url=live_url(config, name))
+        with standalone_output():
+            html = file_html(page, CDN, '{} ({})'.format(title, name))
+        write_file(os.path.join(folder, pages[name]), html)
+    write_file(os.path.join(folder, views_file),
+               json.dumps({'snapshot_id': dataset['snapshot_id'], 'month': dataset['month'], 'pages': pages},
+                          indent=1))
+    log.info('static views of %s (%s) written to %s', dataset['path'], dataset['month'], folder)
+    return pages
+
+
+def update_views(config, dataset):
+    """
+    renders the views for a newly loaded dataset, unless its static_folder has them already (another process)
+    """
+    if config.get('static_folder') and not is_current(config['static_folder'], dataset):
+        render_views(config, dataset)
+
+
+def main(args):
+    config = getattr(app_configs, args[0] if args else 'prod')
+    folder = args[1] if len(args) > 1 else config.get('static_folder')
+    if not folder:
+        sys.exit('no static_folder in the config - give a folder')
+    path = config.get('master_file') or snapshot.newest_pickle(config['data_folder'])
+    pages = render_views(config, shared.get_dataset(path, config['usage']), folder)
+    print('{} -> {}'.format(', '.join(pages.values()), folder))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
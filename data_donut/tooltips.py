@@ -0,0 +1,202 @@
+"""
+recordset, category & usage tooltip templates for the donut chart, and the recordset columns they use
+
+Plain strings - no bokeh - so the chart data builders (data_donut.shared) know which master columns
+a session's recordset source needs (rec_columns) without importing the app. The long contribution
+lists (detail_cols) are only fetched for hovered recordsets - see DonutApp.callback_detail.
+"""
+import re
+
+from data_donut import geometry
+
+# extra recordset columns the usage ring reads (its bars, & the wedge radii while it's shown)
+usage_cols = ['usage_rad', 'usage_col', 'inner_usage', 'outer_usage']
+
+# long per-dataset text the tooltips show as @detail_id{<column>} - not in the recordset source, but looked up
+# by the recordset's master row (detail_id) from the session's detail source when a wedge is hovered
+detail_cols = ['country_events_contrib', 'rmid_events_contrib', 'dk_ftv_contrib']
+
+# Tooltips configured as custom html elements
+TOOLTIPS_1 = """
+    <div>
+        <div
+        style="width:500px; margin-top: 5px; margin-bottom: 5px"
+        </div>
+        <div>
+            <span style="font-size: 16px; font_weight: bold ">@dataset_title</span>
+        </div>
+         <div>
+            <span style="font-size: 14px;">(@str_from_events items)</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Category: @cat_title</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Type: @recordtype</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Hintable? @hintable    </span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Exclusive? @exclusive</span>
+        </div>
+
+        <br style="margin-bottom:15px;"/>
+        <div>
+            <span style="font-size: 12px; font_weight: bold ">Source country classifications:</span>
+        </div>
+        <div>
+            <span style="font-size: 11px;">@detail_id{country_events_contrib}</span>
+        </div>
+        <br style="margin-bottom:15px;"/>
+        <div>
+            <span style="font-size: 12px; font_weight: bold ">rmid contributions:</span>
+        </div>
+        <div>
+            <span style="font-size: 11px;">@detail_id{rmid_events_contrib}</span>
+        </div>
+    </div>
+"""
+
+TOOLTIPS_2 = """
+    <div>
+        <div
+        style="width:500px; margin-top: 5px; margin-bottom: 5px"
+        </div>
+        <div>
+            <span style="font-size: 16px; font_weight: bold ">@cat_title</span>
+        </div>
+         <div>
+            <span style="font-size: 14px;">(@str_from_events events)</span>
+        </div>
+    </div>
+"""
+
+# comparison mode line for the recordset tooltip ({compare_month} - the month compared with)
+TOOLTIP_CHANGE = """
+        <div>
+            <span style="font-size: 12px;">Since {compare_month}: @change_text</span>
+        </div>
+"""
+
+# history sparkline line for the recordset & category tooltips ({first} - {last} - the months it spans,
+# {column} - sparkline / cat_sparkline)
+TOOLTIP_SPARKLINE = """
+        <div>
+            <span style="font-size: 12px;">Items by month ({first} - {last}): <tt>@{column}</tt></span>
+        </div>
+"""
+
+# usage tooltip - the usage month ({usage_date}) is the data file's month
+TOOLTIPS_3 = """
+    <div>
+        <div
+        style="width:500px; margin-top: 5px; margin-bottom: 5px"
+        </div>
+        <div>
+            <span style="font-size: 16px; font_weight: bold ">@dataset_title</span>
+        </div>
+         <div>
+            <span style="font-size: 14px;">(@str_from_events items)</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Category: @cat_title</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Type: @recordtype</span>
+        </div>
+        <br style="margin-bottom:15px;"/>
+        <div>
+            <span style="font-size: 14px; font_weight: bold ">Usage stats ({usage_date}):</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Usage percentile (FTV per 1,000 items, in type) : @usage_perc</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">First time views (FTV): @ft_view{{,}}</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">FTV per 1,000 items: @ftv_index</span>
+        </div>
+        <br style="margin-bottom:5px;"/>
+        <div>
+            <span style="font-size: 12px;">Usage percentile (TOTV per 1,000 items, in type) : @usage_perc_totv</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">Total views (TOTV): @tot_view{{,}}</span>
+        </div>
+        <div>
+            <span style="font-size: 12px;">TOTV per 1,000 items: @totv_index</span>
+        </div>
+        <br style="margin-bottom:5px;"/>
+        <div>
+            <span style="font-size: 12px;">FTV / Total View ratio: @ft_totv_ratio</span>
+        </div>
+        <br style="margin-bottom:15px;"/>
+        <div>
+            <span style="font-size: 12px; font_weight: bold ">DatasetKey (in fulfillments service) FTV contributions:</span>
+        </div>
+        <div>
+            <span style="font-size: 11px;">@detail_id{{dk_ftv_contrib}}</span>
+        </div>
+    </div>
+"""
+
+# taptool URL
+url = "https://search.findmypast.co.uk/search-world-Records/@dataset_url"
+
+
+def sparkline_line(dataset, column):
+    first, last = dataset['sparkline_months']
+    return TOOLTIP_SPARKLINE.format(first=first, last=last, column=column)
+
+
+def rec_tooltips(dataset):
+    """
+    recordset tooltip for a dataset - with the change line for a comparison & the history sparkline
+    """
+    lines = ''
+    if 'compare_month' in dataset:
+        lines += TOOLTIP_CHANGE.format(compare_month=dataset['compare_month'])
+    if 'sparkline_months' in dataset:
+        lines += sparkline_line(dataset, 'sparkline')
+    marker = '        <br style="margin-bottom:15px;"/>'
+    return TOOLTIPS_1.replace(marker, lines + marker, 1)
+
+
+def cat_tooltips(dataset):
+    """
+    category tooltip for a dataset - with the history sparkline
+    """
+    if 'sparkline_months' not in dataset:
+        return TOOLTIPS_2
+    marker = '    </div>\n'
+    return TOOLTIPS_2[:TOOLTIPS_2.rindex(marker)] + sparkline_line(dataset, 'cat_sparkline') + marker
+
+
+def usage_tooltips(dataset):
+    """
+    usage tooltip for a dataset - its usage month is the data file's month
+    """
+    return TOOLTIPS_3.format(usage_date=dataset['month'])
+
+
+def fields(template):
+    """
+    column names a tooltip / url template references (@col, @{col})
+    """
+    return re.findall(r'@\{?(\w+)', template)
+
+
+def rec_columns(dataset):
+    """
+    the recordset source columns for a dataset: wedge geometry, the fields of its tooltips & the taptool url,
+    and the usage ring columns for a usage dataset
+    """
+    templates = [rec_tooltips(dataset), url]
+    extra = []
+    if dataset['usage']:
+        templates.append(usage_tooltips(dataset))
+        extra = usage_cols
+    columns = geometry.wedge_cols + extra + [x for template in templates for x in fields(template)]
+    return list(dict.fromkeys(columns))
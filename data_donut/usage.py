@@ -0,0 +1,97 @@
+"""
+the usage ring - each recordset's usage percentile (first time & total views per 1,000 items, within its
+recordtype) as a bar radius & colour bucket
+
+add_usage runs once per snapshot (data.format_cat_and_master, for apps showing usage): ring radii from the
+file's percentiles (ftv_ratio_scaled / totv_ratio_scaled) relative to the snapshot's mean, an int8 colour
+bucket from one np.digitize over the bucket edges, and its colour. selection_usage recomputes the
+percentiles, radii & colours within a selection (the app's 'within selection' usage percentiles), ranking
+each recordtype's sorted ratios - no per-row Python, so it can run on every redraw. Plain numpy / pandas.
+"""
+import numpy as np
+import pandas as pd
+
+from data_donut import formatting
+
+# usage ring - centre & half depth of the usage bars, overhang of the category lines
+ug_cent = 335
+ug_half = 40
+ug_over = 5
+usage_pal = ['#1a9641', '#a6d96a', '#fdae61', '#d7191c']  # bokeh.palettes.RdYlGn[4]
+
+# radius bucket edges (top of each bucket) - buckets 0 (lowest) .. 3 (highest), 4 for no usage data
+bucket_edges = np.array([ug_cent-(ug_half/2), ug_cent, ug_cent+(ug_half/2)])
+bucket_colors = np.array(usage_pal[::-1] + [None], dtype=object)
+
+
+def percentiles(values, groups):
+    """
+    percentile of each value within its group, from average ranks (ties share the mean of their ranks):
+    (rank - 1) / (n - 1), 0.5 in a group of one. NaN values stay NaN (& aren't ranked). close to the file's
+    *_ratio_scaled columns (within 0.01) but not their formula - which isn't known: a recordtype with a
+    single recordset (e.g. 'articles' in older months) gets 0.5 here, other values in the file
+    """
+    values = np.asarray(values, dtype=float)
+    codes, uniques = pd.factorize(groups)
+    result = np.full(len(values), np.nan)
+    valid = ~np.isnan(values)
+    for code in range(len(uniques)):
+        rows = valid & (codes == code)
+        ranked = np.sort(values[rows])
+        if len(ranked) == 1:
+            result[rows] = 0.5
+        elif len(ranked):
+            rank = (np.searchsorted(ranked, values[rows], 'left') + np.searchsorted(ranked, values[rows], 'right')
+                    + 1) / 2
+            result[rows] = (rank - 1) / (len(ranked) - 1)
+    return result
+
+
+def radius(scaled):
+    """
+    usage bar outer radius of percentiles - ug_cent at their mean, +/- ug_half at 0.25 above / below it
+    """
+    scaled = np.asarray(scaled, dtype=float)
+    if np.isnan(scaled).all():
+        return scaled.copy()
+    return ug_cent+(2*(scaled-np.nanmean(scaled))*ug_half)
+
+
+def bucket(rad):
+    """
+    colour bucket (int8) of usage bar radii - 0 (lowest) .. 3 (highest), 4 for no usage data
+    """
+    return np.where(np.isnan(rad), len(bucket_edges)+1, np.digitize(rad, bucket_edges, right=True)).astype(np.int8)
+
+
+def usage_columns(ftv_scaled, totv_scaled):
+    """
+    usage ring columns of ftv & totv percentiles: usage_rad (ftv), usage_rad_totv, usage_bucket & usage_col
+    """
+    rad = radius(ftv_scaled)
+    buckets = bucket(rad)
+    return {'usage_rad': rad, 'usage_rad_totv': radius(totv_scaled), 'usage_bucket': buckets,
+            'usage_col': bucket_colors[buckets]}
+
+
+def add_usage(df):
+    """
+    adds the usage ring columns (usage_columns) for a snapshot's master df, from the file's percentiles
+    (usage display strings are added by formatting.format_master)
+    """
+    for col, values in usage_columns(df['ftv_ratio_scaled'].values, df['totv_ratio_scaled'].values).items():
+        df[col] = values
+    return df
+
+
+def selection_usage(df):
+    """
+    selected master rows with their usage percentiles (ftv_ratio_scaled, totv_ratio_scaled & the usage_perc
+    strings) & ring columns recomputed within the selection. returns a new df
+    """
+    ftv_scaled = percentiles(df['ftv_ratio'].values, df['recordtype'].values)
+    totv_scaled = percentiles(df['totv_ratio'].values, df['recordtype'].values)
+    return df.assign(ftv_ratio_scaled=ftv_scaled, totv_ratio_scaled=totv_scaled,
+                     usage_perc=formatting.percentile_string(ftv_scaled),
+                     usage_perc_totv=formatting.percentile_string(totv_scaled),
+                     **usage_columns(ftv_scaled, totv_scaled))
@@ -0,0 +1,182 @@
+"""
+follows the newest df_output_for_donut_MMYY.pkl in a folder, reloading it in the background
+
+Apps whose config has no fixed master_file show the latest month in their data_folder. A daemon
+thread polls the folder every reload_seconds; when a newer month appears (or the current file is
+re-exported) it converts the snapshot, adds the month to the history store, prepares the dataset and
+warms the chart cache for the default view - all off the request path - then swaps it in as the
+folder's current dataset in one step & renders the static preset pages (data_donut.static, for configs
+with a static_folder). New sessions get the new month straight away; open sessions are told through
+the listener they registered with subscribe. The first session of a process only waits for the
+snapshot & dataset - the history store & static pages follow on a thread of their own (finish_load).
+"""
+import logging
+import os
+import threading
+import time
+
+from data_donut import geometry, history, shared, snapshot
+
+log = logging.getLogger(__name__)
+
+_current = {}     # (folder, usage) -> current dataset
+_listeners = {}   # (folder, usage) -> list of listener(dataset)
+_watchers = {}    # (folder, usage) -> watcher thread
+_lock = threading.Lock()
+
+
+def watch_key(config):
+    return (os.path.abspath(config['data_folder']), config['usage'])
+
+
+def default_selection(config, dataset):
+    """
+    select_data arguments for a new session's widgets (sliders at their ends, every country)
+    """
+    return dict(cat_min=0, cat_max=config['cat_max_end']*1000000, rec_min=0,
+                rec_max=config['recordset_max_end']*1000000,
+                country=[x for x in range(len(dataset['country_list']))])
+
+
+def warm_cache(config, dataset):
+    """
+    builds the default view's chart data into the cache, so the first session on a new month is a cache hit
+    """
+    selection = default_selection(config, dataset)
+    radii = geometry.set_default_rads(show_exclusive=config['exclusive'])
+    shared.chart_data(config, dataset, selection, radii)
+
+
+def load_newest(config, update_history=True):
+    """
+    loads & warms the newest month in the config's data_folder - converting its snapshot first when that
+    is missing or out of date, and adding new months to the history store (unless not update_history - see
+    finish_load). returns the dataset, None if the folder has no data files
+    """
+    path = snapshot.newest_pickle(config['data_folder'])
+    if path is None:
+        return None
+    try:
+        # one process at a time (bokeh serve --num-procs) - the others find the snapshot current after waiting
+        with snapshot.file_lock(os.path.join(config['data_folder'], '.donut.lock')):
+            if not snapshot.is_current(snapshot.snapshot_dir(path), path):
+                snapshot.convert(path)
+            if update_history:
+                history.update_store(config.get('month_folders') or [config['data_folder']])
+    except OSError:   # e.g. a read-only data folder - read_master falls back to the pickle, no sparklines
+        log.warning('could not write snapshot / history store for %s', path, exc_info=True)
+    dataset = shared.load_dataset(path, config['usage'])
+    warm_cache(config, dataset)
+    return dataset
+
+
+def render_static(config, dataset):
+    """
+    renders the static preset pages of a newly loaded month (data_donut.static), for configs with a static_folder
+    """
+    if not config.get('static_folder'):
+        return
+    try:
+        from data_donut import static   # (imports bokeh)
+        static.update_views(config, dataset)
+    except Exception:   # sessions are still served live
+        log.exception('rendering static views of %s failed', dataset['path'])
+
+
+def finish_load(config):
+    """
+    the slower part of a first load, on a thread of its own (the first session only waits for its dataset):
+    adds new months to the history store - reloading the current month with the new sparklines & swapping it
+    in for new sessions when it changed - then renders the static preset pages
+    """
+    key = watch_key(config)
+    try:
+        with snapshot.file_lock(os.path.join(config['data_folder'], '.donut.lock')):
+            rebuilt = history.update_store(config.get('month_folders') or [config['data_folder']])
+        if rebuilt:
+            dataset = load_newest(config, update_history=False)
+            shared.put_dataset(dataset)
+            with _lock:
+                if _current.get(key, {}).get('path') == dataset['path']:   # (unless the watcher moved on)
+                    _current[key] = dataset
+    except Exception:   # sessions keep the dataset without the new month's sparklines
+        log.exception('updating the history store for %s failed', config['data_folder'])
+    render_static(config, _current[key])
+
+
+def current_dataset(config):
+    """
+    the dataset an app config shows: its fixed master_file, or the current month of its data_folder
+    - loaded on first use, which also starts the folder's watcher (when the config has reload_seconds)
+    """
+    if config.get('master_file'):
+        return shared.get_dataset(config['master_file'], config['usage'])
+    key = watch_key(config)
+    with _lock:
+        if key not in _current:
+            dataset = load_newest(config, update_history=False)
+            if dataset is None:
+                raise FileNotFoundError('no df_output_for_donut_MMYY.pkl in {}'.format(key[0]))
+            shared.put_dataset(dataset)
+            _current[key] = dataset
+            threading.Thread(target=finish_load, args=(config,), daemon=True,
+                             name='data_donut history {}'.format(key[0])).start()
+            if config.get('reload_seconds') and key not in _watchers:
+                _watchers[key] = threading.Thread(target=_watch, args=(config,), daemon=True,
+                                                  name='data_donut watcher {}'.format(key[0]))
+                _watchers[key].start()
+        return _current[key]
+
+
+def check(config):
+    """
+    swaps in the newest month of the config's data_folder (or a re-exported current file) if it differs from
+    the current dataset, then calls the listeners & renders its static pages. returns the new dataset, None if
+    nothing changed
+    """
+    key = watch_key(config)
+    current = _current.get(key)
+    path = snapshot.newest_pickle(config['data_folder'])
+    if path is None or (current is not None and os.path.abspath(path) == current['path']
+                        and shared.snapshot_id(current['path']) == current['snapshot_id']):
+        return None
+
+    dataset = load_newest(config)   # sessions keep using the current dataset meanwhile
+    shared.put_dataset(dataset)
+    with _lock:
+        _current[key] = dataset
+        listeners = list(_listeners.get(key, []))
+    log.info('now serving %s (%s)', dataset['path'], dataset['month'])
+    for listener in listeners:
+        listener(dataset)
+    if current is not None:
+        shared.drop_dataset(current)
+    render_static(config, dataset)
+    return dataset
+
+
+def _watch(config):
+    while True:
+        time.sleep(config['reload_seconds'])
+        try:
+            check(config)
+        except Exception:   # keep serving the current month - and keep watching
+            log.exception('reloading %s failed', config['data_folder'])
+
+
+def subscribe(config, listener):
+    """
+    registers listener(dataset) - called from the watcher thread - for new datasets of the config's folder.
+    returns a function that unregisters it (configs with a fixed master_file never change)
+    """
+    if config.get('master_file'):
+        return lambda: None
+    key = watch_key(config)
+    with _lock:
+        _listeners.setdefault(key, []).append(listener)
+
+    def unsubscribe():
+        with _lock:
+            if listener in _listeners.get(key, []):
+                _listeners[key].remove(listener)
+    return unsubscribe
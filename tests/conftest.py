@@ -0,0 +1,38 @@
+"""
+month datasets for the tests - the repo's month pickles, loaded as the apps load them (shared.load_dataset) from
+a temporary folder, so no snapshot, filter index or history store is written into the tree
+"""
+import os
+
+import pytest
+
+from data_donut import shared
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONTHS = ['df_output_for_donut_0623.pkl', 'df_output_for_donut_0724.pkl', 'df_output_for_donut_0924.pkl']
+
+# select_data arguments selecting every row
+EVERYTHING = dict(cat_min=0, cat_max=10**12, rec_min=0, rec_max=10**12, country=[])
+
+
+@pytest.fixture(scope='session')
+def month_folder(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('months')
+    for name in MONTHS:
+        os.symlink(os.path.join(ROOT, name), os.path.join(folder, name))
+    cwd = os.getcwd()
+    os.chdir(folder)   # (the history store path is relative)
+    yield folder
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def months(month_folder):
+    # {'0623': dataset, ...} - without usage columns
+    return {name[-8:-4]: shared.load_dataset(os.path.join(month_folder, name)) for name in MONTHS}
+
+
+@pytest.fixture(scope='session')
+def comparison(months):
+    # Sept 2024 compared with July 2024
+    return shared.get_comparison(months['0924'], months['0724'])
@@ -0,0 +1,75 @@
+"""
+chart data cache (data_donut.cache through shared.chart_data) - hits for settings giving the same chart,
+entries per app ring settings, invalidation per snapshot & LRU eviction
+"""
+import numpy as np
+import pytest
+
+from conftest import EVERYTHING
+from data_donut import cache, geometry, shared, tooltips
+
+
+@pytest.fixture
+def empty_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_ring_settings_get_their_own_entries(months, empty_cache):
+    # same snapshot & selection, apps with & without the exclusivity ring
+    dataset = months['0924']
+    charts = {}
+    for exclusive in [True, False]:
+        config = {'exclusive': exclusive, 'min_wedge_degrees': 0}
+        radii = geometry.set_default_rads(show_exclusive=exclusive)
+        charts[exclusive] = shared.chart_data(config, dataset, EVERYTHING, radii)
+        assert charts[exclusive] is shared.chart_data(config, dataset, EVERYTHING, radii)
+    assert charts[True] is not charts[False]
+    assert charts[True]['rec']['inner'].max() > charts[False]['rec']['inner'].max()
+
+
+def test_same_chart_settings_hit(months, empty_cache):
+    dataset = months['0924']
+    config = {'exclusive': False, 'min_wedge_degrees': 0.1}
+    radii = geometry.set_default_rads()
+    events = np.sort(dataset['master']['events'].values)
+    gap = np.flatnonzero(np.diff(events) > 2)[len(events)//2]   # (a recordset size with room either side of it)
+    selection = dict(EVERYTHING, rec_min=events[gap] + 1, country=[7, 20])
+
+    chart = shared.chart_data(config, dataset, selection, radii)
+    before = cache.stats()
+    # slider values selecting the same rows, the same countries in another order - the same entry
+    assert shared.chart_data(config, dataset, dict(selection, rec_min=events[gap] + 2), radii) is chart
+    assert shared.chart_data(config, dataset, dict(selection, cat_max=10**13), radii) is chart
+    assert shared.chart_data(config, dataset, dict(selection, country=[20, 7, 7]), radii) is chart
+    after = cache.stats()
+    assert after['hits'] == before['hits'] + 3 and after['size'] == before['size']
+
+    # ... another selection is built - as it would be without the cache
+    other = shared.chart_data(config, dataset, dict(selection, hintable=0), radii)
+    assert other is not chart and other['datasets'] < chart['datasets']
+    built = geometry.dataset_chart_data(dataset, dict(selection, hintable=0), radii,
+                                        tooltips.rec_columns(dataset), np.radians(0.1))
+    assert other['datasets'] == built['datasets'] and list(other['rec']['start']) == list(built['rec']['start'])
+
+
+def test_invalidate_drops_one_snapshot(months, empty_cache):
+    config = {'exclusive': False, 'min_wedge_degrees': 0}
+    radii = geometry.set_default_rads()
+    charts = {x: shared.chart_data(config, months[x], EVERYTHING, radii) for x in ['0724', '0924']}
+    cache.invalidate(months['0924']['snapshot_id'])
+    assert shared.chart_data(config, months['0724'], EVERYTHING, radii) is charts['0724']
+    rebuilt = shared.chart_data(config, months['0924'], EVERYTHING, radii)
+    assert rebuilt is not charts['0924'] and rebuilt['datasets'] == charts['0924']['datasets']
+
+
+def test_least_recently_used_are_evicted(monkeypatch, empty_cache):
+    monkeypatch.setattr(cache, 'max_entries', 2)
+    for key in ['a', 'b']:
+        cache.put(('snap', key), key)
+    assert cache.get(('snap', 'a')) == 'a'   # (b is now the least recently used)
+    cache.put(('snap', 'c'), 'c')
+    assert cache.get(('snap', 'b')) is None
+    assert cache.get_or_build(('snap', 'a'), lambda: 'rebuilt') == 'a'
+    assert cache.stats()['size'] == 2
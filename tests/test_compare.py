@@ -0,0 +1,84 @@
+"""
+month-over-month comparison data (compare.join_months / prepare_comparison)
+"""
+import numpy as np
+import pandas as pd
+
+from conftest import EVERYTHING
+from data_donut import compare, data, geometry
+
+
+def current_totals(dataset):
+    master = dataset['master']
+    return master['events'].groupby(master['category'], observed=True).sum()
+
+
+def test_category_totals_are_current_month(months, comparison):
+    # wedges are sized by max(now, previous) - category totals, their text & the category sliders are not
+    totals = current_totals(months['0924'])
+    cat_df = comparison['cat_master_df']
+    assert cat_df['events'].reindex(totals.index).tolist() == totals.astype(float).tolist()
+    assert (cat_df['events'].drop(totals.index) == 0).all()   # (categories only the previous month has)
+
+    radii = geometry.set_default_rads()
+    chart = geometry.dataset_chart_data(comparison, EVERYTHING, radii)
+    cat = dict(zip(chart['cat']['category'], chart['cat']['events']))
+    assert [cat[x] for x in totals.index] == totals.astype(float).tolist()
+    text = dict(zip(chart['cat']['category'], chart['cat']['str_from_events']))
+    assert [text[x] for x in totals.index] == list(geometry.millions_string(totals.values.astype(float)))
+    assert chart['items'] == totals.sum()
+
+    # the same in the browser's layout (client filters), with every recordset shown
+    client = geometry.dataset_chart_data(comparison, EVERYTHING, radii, geometry.wedge_cols + geometry.client_cols)
+    laid_out = geometry.client_layout(client, np.ones(client['datasets'], dtype=bool))
+    cat = dict(zip(laid_out['cat']['category'], laid_out['cat']['events']))
+    assert [cat[x] for x in totals.index] == totals.astype(float).tolist()
+
+    # category size slider - a minimum just above a category's current total leaves it out
+    smallest = totals.idxmin()
+    assert smallest not in data.selected_categories(comparison, totals.min() + 1, 10**12)
+
+
+def month_frame(rows):
+    # (dataset, dataset_orig, events) rows as a formatted master df
+    df = pd.DataFrame(rows, columns=['dataset', 'dataset_orig', 'events'])
+    df['category'] = 'census'
+    return df
+
+
+def test_signed_count():
+    assert list(compare.signed_count([5812, -120, 0, 1234567, -0.4])) == ['+5,812', '-120', '+0', '+1,234,567', '-0']
+
+
+def test_join_months_changes():
+    previous = month_frame([('a', 'a', 100), ('b', 'b', 50), ('c', 'c', 10), ('d', 'd', 7),
+                            ('e (part 1)', 'e', 20), ('e (part 2)', 'e', 30)])
+    current = month_frame([('a', 'a', 100), ('b', 'b', 80), ('c', 'c', 4), ('f', 'f', 1000),
+                           ('e (part 2)', 'e', 35), ('e (part 1)', 'e', 20)])
+    df = compare.join_months(current, previous)
+
+    joined = df.set_index('dataset')
+    assert list(df['dataset']) == ['a', 'b', 'c', 'f', 'e (part 2)', 'e (part 1)', 'd']   # removed rows last
+    assert joined['change'].to_dict() == {'a': 'unchanged', 'b': 'grown', 'c': 'shrunk', 'f': 'new',
+                                          'e (part 2)': 'grown', 'e (part 1)': 'unchanged', 'd': 'removed'}
+    assert joined['prev_events'].to_dict() == {'a': 100, 'b': 50, 'c': 10, 'f': 0, 'e (part 2)': 30,
+                                               'e (part 1)': 20, 'd': 7}
+    assert (joined['events_delta'] == joined['events_now'] - joined['prev_events']).all()
+    assert (joined['events'] == np.maximum(joined['events_now'], joined['prev_events'])).all()
+    assert joined.loc['c', 'change_text'] == 'shrunk: 0.000 m -> 0.000 m items (-6)'
+    assert joined.loc['f', 'change_text'] == 'new: 0.000 m -> 0.001 m items (+1,000)'
+    assert joined.loc['d', 'change_text'] == 'removed: 0.000 m -> 0.000 m items (-7)'
+
+    summary = compare.change_summary(df)
+    assert summary == {'new': 1, 'removed': 1, 'grown': 2, 'shrunk': 1, 'unchanged': 2,
+                       'delta': 1239 - 217}
+
+
+def test_comparison_counts(months, comparison):
+    # change counts & net change of the whole comparison against the two months' dataset keys & totals
+    current, previous = months['0924']['master'], months['0724']['master']
+    now, before = set(data.dataset_keys(current)), set(data.dataset_keys(previous))
+    summary = compare.change_summary(comparison['master'])
+    assert summary['new'] == len(now - before) and summary['removed'] == len(before - now)
+    assert sum(summary[x] for x in compare.changes) == len(now | before)
+    assert summary['delta'] == current['events'].sum() - previous['events'].sum()
@@ -0,0 +1,147 @@
+"""
+row selection (data_donut.data): select_data against the original pandas filter (data_summary_prod.select_data
+before the filter index) on a month converted to a snapshot, live slider counts & country presets
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import EVERYTHING, ROOT
+from data_donut import config as app_configs
+from data_donut import data, formatting, snapshot
+
+MONTH = os.path.join(ROOT, 'df_output_for_donut_0623.pkl')
+
+
+@pytest.fixture(scope='module')
+def month(tmp_path_factory):
+    master = formatting.format_master(pd.read_pickle(MONTH))
+    folder = snapshot.write_snapshot(master, str(tmp_path_factory.mktemp('month') / 'month.donut'), formatted=True)
+    return master, data.prepare_dataset(snapshot.read_snapshot(folder))
+
+
+def baseline_select(master, cat_master_df, country_list, cat_min, cat_max, rec_min, rec_max, country, hintable=2,
+                    exclusive=2, recordtype=[0, 1, 2, 3], cat_select='ALL'):
+    # the masks the app built before the filter index, on the formatted master
+    if cat_select == 'ALL':
+        cat_list = cat_master_df.loc[(cat_master_df['events'] >= cat_min) & (cat_master_df['events'] <= cat_max)].index
+        cat_mask = master['category'].isin(cat_list)
+    else:
+        cat_mask = master['category'] == cat_select.lower()
+    rec_mask = (master['events'] > rec_min) & (master['events'] < rec_max)
+    hint_mask = master['hintable'].isin(data.yes_no_options[hintable])
+    excl_mask = master['exclusive'].isin(data.yes_no_options[exclusive])
+    rec_type_mask = master['recordtype'].isin([data.type_list[i] for i in recordtype])
+    country_mask = master['source_country_list'].str.contains('|'.join(country_list[i] for i in country))
+    return master.loc[cat_mask & rec_mask & hint_mask & excl_mask & rec_type_mask & country_mask]
+
+
+def distinct_countries(country_list):
+    # countries no other country's name contains - the baseline's regex matched those as substrings
+    # (e.g. 'England' in 'New England'), select_data matches exact country tokens
+    return [i for i, name in enumerate(country_list) if not any(name in x for x in country_list if x != name)]
+
+
+def widget_states(dataset):
+    countries = distinct_countries(dataset['country_list'])
+    cat_events = dataset['cat_master_df']['events'].sort_values()
+    return [dict(cat_min=0, cat_max=10**12, rec_min=0, rec_max=10**12, country=[]),
+            dict(cat_min=int(cat_events.iloc[len(cat_events)//4]), cat_max=int(cat_events.iloc[-2]), rec_min=1000,
+                 rec_max=500000, country=countries[:3], hintable=0, exclusive=1, recordtype=[0, 1]),
+            dict(cat_min=0, cat_max=10**12, rec_min=100, rec_max=10**8, country=countries[-2:], hintable=1,
+                 recordtype=[2, 3]),
+            dict(cat_min=0, cat_max=0, rec_min=0, rec_max=10**12, country=[], exclusive=0,
+                 cat_select=dataset['cat_select_menu'][1])]
+
+
+def test_select_data_matches_baseline(month):
+    master, dataset = month
+    for state in widget_states(dataset):
+        selected = data.select_data(dataset, **state)
+        expected = baseline_select(master, dataset['cat_master_df'], dataset['country_list'], **state)
+        assert len(expected), state   # (states that select something)
+        assert list(selected.index) == list(expected.index), state
+        for col in ['dataset', 'events', 'category', 'hintable', 'source_country_list']:
+            assert list(selected[col]) == list(expected[col]), (state, col)
+
+
+def test_select_data_keeps_columns_mapped(month):
+    master, dataset = month
+    frame = dataset['master']
+    for col in ['events', 'category']:
+        values = getattr(frame[col].values, 'codes', frame[col].values)   # (a categorical's codes)
+        while values is not None and not isinstance(values, np.memmap):
+            values = values.base
+        assert values is not None, col
+    assert frame['events'].dtype == master['events'].dtype
+    assert frame['category'].dtype == 'category'
+    assert data.select_data(dataset, **widget_states(dataset)[0]).shape[0] == len(master)
+
+
+def test_older_filter_index_is_rebuilt(tmp_path):
+    # an index stored by an older build_filter_index (without category_code) is replaced, not used
+    master = formatting.format_master(pd.read_pickle(MONTH))
+    folder = snapshot.write_snapshot(master, str(tmp_path / 'month.donut'), formatted=True)
+    old = data.prepare_dataset(snapshot.read_snapshot(folder))['filter_index']
+    snapshot.write_index(folder, {k: v for k, v in old.items() if k != 'category_code'},
+                         data.FILTER_INDEX_VERSION - 1)
+
+    dataset = data.prepare_dataset(snapshot.read_snapshot(folder))
+    assert 'category_code' in dataset['filter_index']
+    assert 'category_code' in snapshot.read_index(folder, data.FILTER_INDEX_VERSION)
+    summary = data.summary_index(dataset, data.click_mask(dataset, []))
+    assert data.summary_counts(dataset, summary, 0, 10**12, 0, 10**12)['datasets'] == len(master)
+
+
+@pytest.mark.parametrize('compared', [False, True])
+def test_summary_counts_match_select_data(months, comparison, compared):
+    # live slider counts (prefix sums over the click selection) against counting the selected rows
+    dataset = comparison if compared else months['0924']
+    rng = np.random.default_rng(17)
+    cat_events = np.sort(dataset['cat_master_df']['events'].values)
+    events = np.sort(dataset['master']['events'].values)
+    n_countries = len(dataset['country_list'])
+    for _ in range(40):
+        ticked = rng.integers(0, 3)*rng.integers(0, 2)   # (no countries ticked - all of them - half the time)
+        click = dict(country=sorted(rng.choice(n_countries, ticked, replace=False).tolist()),
+                     hintable=int(rng.integers(3)), exclusive=int(rng.integers(3)),
+                     recordtype=sorted(rng.choice(4, rng.integers(2, 5), replace=False).tolist()))
+        # (slider minimums from the lower half of the values, maximums from the upper half)
+        cat_min, cat_max = rng.choice(cat_events[:len(cat_events)//2]), rng.choice(cat_events[len(cat_events)//2:])
+        rec_min, rec_max = rng.choice(events[:len(events)//2]), rng.choice(events[len(events)//2:])
+        sliders = dict(cat_min=cat_min, cat_max=cat_max, rec_min=rec_min - 1, rec_max=rec_max + 1,
+                       cat_select='ALL' if rng.random() < 0.8 else dataset['cat_select_menu'][1])
+        summary = data.summary_index(dataset, data.click_mask(dataset, **click))
+        counts = data.summary_counts(dataset, summary, **sliders)
+        selected = data.select_data(dataset, **sliders, **click)
+        items = selected['events_now' if compared else 'events'].sum()
+        assert counts['datasets'] == len(selected), (click, sliders)
+        assert counts['categories'] == selected['category'].nunique()
+        assert counts['items'] == pytest.approx(items)
+
+
+def test_presets_resolve_by_country_name(months):
+    presets = dict(app_configs.prod['country_dd'], Nowhere=['Atlantis'])
+    for month, dataset in months.items():
+        country_list = dataset['country_list']
+        resolved = data.resolve_presets(dataset, presets)
+        assert resolved is data.resolve_presets(dataset, presets)   # (cached in the dataset)
+        assert resolved['ALL'] == list(range(len(country_list)))
+        for name, names in presets.items():
+            if names is not None:
+                assert [country_list[i] for i in resolved[name]] == sorted(set(names) & set(country_list)), month
+        # a preset the month has none of resolves to no countries - & is left out of the selector, as no
+        # countries ticked would select every row
+        assert resolved['Nowhere'] == []
+        assert data.available_presets(dataset, presets) == [x for x in presets if resolved[x]]
+        assert 'Nowhere' not in data.available_presets(dataset, presets)
+
+        # each preset selects the rows with any of its countries among their (exact) source countries
+        tokens = dataset['master']['source_country_list'].fillna('').str.split(', ')
+        for name in data.available_presets(dataset, presets):
+            wanted = set(country_list[i] for i in resolved[name])
+            expected = tokens.map(lambda x: bool(wanted & set(x))).values
+            assert (data.country_selection_mask(dataset, resolved[name]) == expected).all(), (month, name)
+            assert data.select_data(dataset, **dict(EVERYTHING, country=resolved[name])).shape[0] == expected.sum()
@@ -0,0 +1,64 @@
+"""
+display strings (data_donut.formatting) against the per-row formatting they replaced
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from data_donut import formatting
+
+MONTHS = sorted(glob.glob(os.path.join(ROOT, 'df_output_for_donut_*.pkl'))
+                + glob.glob(os.path.join(ROOT, 'data_archive', 'df_output_for_donut_*.pkl')))
+
+
+def per_row_millions(values, big='{:,.1f} m'):
+    # the old event_string / str_from_ftv list comprehensions
+    return [big.format(i/1000000) if (i/1000000) > 10 else '{:,.2f} m'.format(i/1000000) if (i/1000000) > 1
+            else '{:,.3f} m'.format(i/1000000) for i in values]
+
+
+def per_row_title(names):
+    # the old dataset_title: title case, then one str.replace per fix
+    titles = names.str.title()
+    for old, new in [('Us', 'US'), ('Uk', 'UK'), ("'S", "'s")]:
+        titles = titles.str.replace(old, new, regex=False)
+    return titles
+
+
+def per_row_url(names):
+    # the old dataset_url: eight chained str.replace calls
+    urls = names
+    for old, new in [(',', ''), ("'", ''), ('(', ''), (')', ''), ('&', 'and'), (' ', '-')]:
+        urls = urls.str.replace(old, new, regex=False)
+    return urls.str.replace(r'vols\.', 'vols', regex=True).str.replace(r'vol\.', 'vol', regex=True)
+
+
+def test_number_strings_at_the_edges():
+    values = np.array([0, 1, 999, 1000, 999999, 1000000, 1000001, 1234567.891, 9999999, 10000000, 10000001,
+                       123456789012, np.nan])
+    assert list(formatting.millions_string(values)) == per_row_millions(values)
+    assert list(formatting.millions_string(values, decimals=(0, 2, 3))) == per_row_millions(values, '{:,.0f} m')
+    for decimals in [0, 3]:
+        assert list(formatting.grouped_string(values, decimals)) == ['{:,.{}f}'.format(x, decimals) for x in values]
+        assert list(formatting.grouped_string(-values, decimals)) == ['{:,.{}f}'.format(-x, decimals) for x in values]
+    assert list(formatting.percentile_string([0, 0.004, 0.005, 0.5, 0.999, 1])) == \
+        ['{:.0f}'.format(x*100) for x in [0, 0.004, 0.005, 0.5, 0.999, 1]]
+
+
+@pytest.mark.parametrize('path', MONTHS, ids=os.path.basename)
+def test_format_master_matches_per_row_strings(path):
+    raw = pd.read_pickle(path)
+    df = formatting.format_master(raw)
+    assert list(df['str_from_events']) == per_row_millions(raw['events'])
+    assert df['dataset_title'].equals(per_row_title(raw['dataset']))
+    assert df['dataset_url'].equals(per_row_url(raw['dataset_orig']))
+    if 'ftv_ratio_scaled' in raw.columns:
+        assert list(df['usage_perc']) == ['{:.0f}'.format(i) for i in raw['ftv_ratio_scaled']*100]
+        assert list(df['usage_perc_totv']) == ['{:.0f}'.format(i) for i in raw['totv_ratio_scaled']*100]
+        assert list(df['str_from_ftv']) == per_row_millions(raw['ft_view'], '{:,.0f} m')
+        assert list(df['ftv_index']) == ['{:,.3f}'.format(i*1000) for i in raw['ftv_ratio']]
+        assert list(df['totv_index']) == ['{:,.3f}'.format(i*1000) for i in raw['totv_ratio']]
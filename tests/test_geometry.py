@@ -0,0 +1,135 @@
+"""
+wedge geometry (data_donut.geometry) against the per-category pandas pipeline it replaced
+"""
+from math import pi
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import EVERYTHING
+from data_donut import data, geometry, shared
+
+
+def per_category_geometry(used_data, radii, start=pi/2):
+    # the old format_cat_df / create_rec_df_dict: categories by events (desc), then each category's recordsets
+    # (events desc) tiling it - add_sizes, add_st_end, add_centre_radius & add_color_alphas per DataFrame copy
+    cat_df = used_data['events'].groupby(used_data['category'], observed=True).sum().astype(float)
+    cat_df = cat_df.sort_values(ascending=False, kind='stable').to_frame('events')
+    cat_df['size'] = cat_df['events'] / cat_df['events'].sum() * pi*2
+    ends = start - cat_df['size'].cumsum().values
+    cat_df['start'], cat_df['end'] = np.r_[start, ends[:-1]], ends
+    cat_df['color'] = (geometry.base_colors*len(cat_df))[:len(cat_df)]
+    rec_dfs = []
+    for category, cat in cat_df.iterrows():
+        df = used_data.loc[used_data['category'] == category].sort_values('events', ascending=False, kind='stable')
+        df = df.copy()
+        df['size'] = df['events'] / df['events'].sum() * cat['size']
+        ends = cat['start'] - df['size'].cumsum().values
+        df['start'], df['end'] = np.r_[cat['start'], ends[:-1]], ends
+        df['inner'] = np.where(df['exclusive'] == 'Yes', radii['radius_2'] + radii['excl_inc'], radii['radius_2'])
+        df['outer'] = np.where(df['hintable'] == 'Yes', radii['radius_3'] + radii['hint_inc'], radii['radius_3'])
+        df['color'] = geometry.color_map[cat['color']]
+        df['alpha'] = (geometry.rec_alphas*len(df))[:len(df)]
+        rec_dfs.append(df)
+    return cat_df, pd.concat(rec_dfs)
+
+
+def selections(dataset):
+    uk = [i for i, x in enumerate(dataset['country_list']) if x in ['England', 'Scotland', 'Wales']]
+    return [EVERYTHING, dict(EVERYTHING, country=uk, hintable=0),
+            dict(EVERYTHING, rec_min=10**5, recordtype=[1, 3]),
+            dict(EVERYTHING, cat_select=dataset['cat_select_menu'][3])]
+
+
+@pytest.mark.parametrize('exclusive', [False, True])
+def test_donut_geometry_matches_per_category_pipeline(months, exclusive):
+    dataset = months['0924']
+    radii = geometry.set_default_rads(show_exclusive=exclusive)
+    for selection in selections(dataset):
+        used_data = data.select_data(dataset, **selection)
+        wedges = geometry.donut_geometry(used_data, radii)
+        cat_df, rec_df = per_category_geometry(used_data, radii)
+
+        cat = wedges['cat']
+        assert list(cat['category']) == list(cat_df.index)
+        for col in ['events', 'size', 'start', 'end']:
+            np.testing.assert_allclose(cat[col], cat_df[col].values, rtol=0, atol=1e-9)
+        assert list(cat['color']) == list(cat_df['color'])
+        assert (cat['inner'] == radii['radius_1']).all() and (cat['outer'] == radii['radius_2']).all()
+
+        rec = wedges['rec']
+        assert list(used_data.index[wedges['order']]) == list(rec_df.index)
+        for col in ['size', 'start', 'end']:
+            np.testing.assert_allclose(rec[col], rec_df[col].values, rtol=0, atol=1e-9)
+        for col in ['inner', 'outer', 'alpha']:
+            assert list(rec[col]) == list(rec_df[col]), col
+        assert list(rec['color']) == list(rec_df['color'])
+
+
+@pytest.mark.parametrize('compared', [False, True])
+def test_merged_wedges_keep_category_totals(months, comparison, compared):
+    # 'other N datasets' wedges replace small recordsets - each category's items, changes & extent are kept
+    dataset = comparison if compared else months['0924']
+    radii = geometry.set_default_rads()
+    full = geometry.dataset_chart_data(dataset, EVERYTHING, radii)['rec']
+    merged = geometry.dataset_chart_data(dataset, EVERYTHING, radii, min_angle=np.radians(0.5))['rec']
+    assert len(merged['events']) < len(full['events'])
+
+    sums = [x for x in ['events', 'events_now', 'events_delta'] if x in full]
+    totals = {name: pd.DataFrame({x: part[x] for x in sums}).groupby(part['category']).sum()
+              for name, part in [('full', full), ('merged', merged)]}
+    pd.testing.assert_frame_equal(totals['merged'], totals['full'], check_dtype=False)   # (merged sums are floats)
+
+    # wedges still tile the circle in the same order, merged ones spanning their recordsets
+    np.testing.assert_allclose(merged['end'][:-1], merged['start'][1:], rtol=0, atol=1e-9)
+    assert merged['start'][0] == full['start'][0] and merged['end'][-1] == full['end'][-1]
+
+    other = np.char.startswith(merged['dataset_title'].astype(str), 'Other ')
+    counts = [int(x.split()[1].replace(',', '')) for x in merged['dataset_title'][other]]
+    assert sum(counts) - len(counts) == len(full['events']) - len(merged['events'])
+    assert (merged['dataset_url'][other] == '').all()
+    assert (merged['str_from_events'][other] == geometry.millions_string(
+        merged['events_now' if compared else 'events'][other])).all()
+
+
+@pytest.mark.parametrize('compared', [False, True])
+def test_client_layout_matches_server_selection(months, comparison, compared):
+    # every recordset laid out for the click controls (as CLIENT_FILTER_JS does) against the server selecting
+    # the same rows - per recordset (by detail_id) & category, and the counts
+    dataset = comparison if compared else months['0924']
+    config = {'exclusive': False, 'min_wedge_degrees': 0}
+    radii = geometry.set_default_rads()
+    everything = shared.chart_data(config, dataset, EVERYTHING, radii, client_filters=True)
+    rng = np.random.default_rng(25)
+    n_countries = len(dataset['country_list'])
+    for _ in range(12):
+        ticked = rng.integers(0, 3)*rng.integers(0, 2)   # (no countries ticked - all of them - half the time)
+        click = dict(country=sorted(rng.choice(n_countries, ticked, replace=False).tolist()),
+                     hintable=int(rng.integers(3)), recordtype=sorted(rng.choice(4, rng.integers(2, 5),
+                                                                                 replace=False).tolist()))
+        laid_out = geometry.client_layout(everything, data.client_mask(everything['rec'], **click))
+        served = shared.chart_data(config, dataset, dict(EVERYTHING, **click), radii)
+        for key in [x for x in ['items', 'datasets', 'categories', 'changes'] if x in served]:   # (no categories
+            assert laid_out[key] == pytest.approx(served[key]), (key, click)                      # when empty)
+        if not served['datasets']:
+            continue
+
+        shown = laid_out['rec']['shown']
+        rec = {col: values[shown] for col, values in laid_out['rec'].items()}
+        order = np.argsort(rec['detail_id'])
+        served_order = np.argsort(served['rec']['detail_id'])
+        assert list(rec['detail_id'][order]) == list(served['rec']['detail_id'][served_order])
+        for col in ['start', 'end']:
+            np.testing.assert_allclose(rec[col][order], served['rec'][col][served_order], rtol=0, atol=1e-9)
+        for col in ['color', 'alpha']:
+            assert list(rec[col][order]) == list(served['rec'][col][served_order]), (col, click)
+
+        cat_shown = laid_out['cat']['shown']
+        cat = {col: values[cat_shown] for col, values in laid_out['cat'].items()}
+        cat_order, served_cat = np.argsort(cat['category']), np.argsort(served['cat']['category'])
+        assert list(cat['category'][cat_order]) == list(served['cat']['category'][served_cat])
+        for col in ['start', 'end', 'events']:
+            np.testing.assert_allclose(cat[col][cat_order], served['cat'][col][served_cat], rtol=0, atol=1e-9)
+        for col in ['color', 'str_from_events']:
+            assert list(cat[col][cat_order]) == list(served['cat'][col][served_cat]), (col, click)
@@ -0,0 +1,64 @@
+"""
+snapshot round trip - write_snapshot / read_snapshot give back the master frame, memory-mapped
+"""
+import numpy as np
+import pandas as pd
+
+from data_donut import snapshot
+
+
+def mapped(values):
+    # True if an array (or a categorical's codes) is a view of a memory-mapped file
+    values = getattr(values, 'codes', values)
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+def sample_frame():
+    return pd.DataFrame({'dataset': ['a', 'b', 'c', 'd'],
+                         'category': ['census', 'military', 'census', np.nan],
+                         'recordtype': ['Records', 'Images', 'Records', 'Documents'],
+                         'events': np.array([5, 100, 2000, 7], dtype=np.int64),
+                         'ftv_ratio': [0.5, np.nan, 0.25, 1.0],
+                         'dataset_alt': ['x', np.nan, 'zé', ''],
+                         'metadataid_list': [['m1'], ['m2', 'm3'], [], ['m4']],
+                         'source_country_list': ['England', 'England, Ireland', 'Ireland', 'Wales']})
+
+
+def test_round_trip(tmp_path):
+    df = sample_frame()
+    snap = snapshot.read_snapshot(snapshot.write_snapshot(df, str(tmp_path / 'sample.donut')))
+    frame = snap['frame']
+
+    assert list(frame.columns) == list(df.columns)
+    assert isinstance(frame.index, pd.RangeIndex) and len(frame) == len(df)
+    # numeric columns keep their dtypes, categoricals come back as categories of the same values
+    assert frame['events'].dtype == np.int64 and frame['ftv_ratio'].dtype == np.float64
+    for col in ['category', 'recordtype']:
+        assert frame[col].dtype == 'category'
+        pd.testing.assert_series_equal(frame[col].astype(object), df[col], check_names=False)
+    pd.testing.assert_frame_equal(frame[['events', 'ftv_ratio', 'dataset', 'dataset_alt']],
+                                  df[['events', 'ftv_ratio', 'dataset', 'dataset_alt']])
+    assert list(frame['metadataid_list']) == list(df['metadataid_list'])
+
+    # country bitset - exact tokens, sorted country list
+    assert snap['countries'] == ['England', 'Ireland', 'Wales']
+    assert np.unpackbits(snap['country_bits'], axis=1)[:, :3].tolist() == [[1, 0, 0], [1, 1, 0], [0, 1, 0],
+                                                                          [0, 0, 1]]
+
+
+def test_columns_stay_mapped(tmp_path):
+    snap = snapshot.read_snapshot(snapshot.write_snapshot(sample_frame(), str(tmp_path / 'sample.donut')))
+    frame = snap['frame']
+    for col in ['events', 'ftv_ratio', 'category', 'recordtype']:
+        assert mapped(frame[col].values), col
+    assert mapped(snap['country_bits'])
+
+
+def test_read_columns(tmp_path):
+    snap = snapshot.read_snapshot(snapshot.write_snapshot(sample_frame(), str(tmp_path / 'sample.donut')),
+                                  columns=['events', 'category'])
+    assert list(snap['frame'].columns) == ['category', 'events']